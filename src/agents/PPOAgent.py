@@ -1,11 +1,15 @@
-from importlib.metadata import distribution
-from typing import Dict, Any, Optional, Tuple
+import ast
+import warnings
+from collections import deque
+from pathlib import Path
+from typing import Dict, Any, Optional, Tuple, Deque
 import numpy as np
 import torch
+import torch.nn as nn
+import torch.nn.functional as F
 import torch.optim as optim
-from pandas.io.stata import stata_epoch
-from sympy.physics.quantum.density import entropy
-from sympy.physics.quantum.gate import normalized
+from safetensors import SafetensorError
+from safetensors.torch import save_file, load_file
 
 from src.agents.agent import Agent
 from src.agents.utils.state_normalizer import RunningNormalizer
@@ -15,6 +19,46 @@ from src.trainings.utils.seed import set_seed
 from src.utils.configs.config_reader import ConfigReader
 
 
+def _ppo_loss(log_probs: torch.Tensor, old_log_probs: torch.Tensor, advantages: torch.Tensor,
+              values: torch.Tensor, old_values: torch.Tensor, returns: torch.Tensor,
+              clip_range: float, vf_coef: float, ent_coef: float,
+              entropy: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+    """
+    Computes the clipped PPO objective. Pure tensor arithmetic so that it can be compiled, or scripted,
+    into fused kernels.
+
+    :param log_probs: Log probabilities of the actions under the current policy
+    :param old_log_probs: Log probabilities of the actions under the rollout policy
+    :param advantages: Advantage estimates
+    :param values: Value estimates of the current critic
+    :param old_values: Value estimates of the rollout critic
+    :param returns: Target returns
+    :param clip_range: Clipping range for both the ratio and the value function
+    :param vf_coef: Value loss coefficient
+    :param ent_coef: Entropy bonus coefficient
+    :param entropy: Mean entropy of the current policy
+    :return: Tuple of (total_loss, policy_loss, value_loss). The policy and value losses are detached,
+        they are only used for statistics.
+    """
+    # Calculate policy loss with clipping. For positive advantages the pessimistic objective picks the
+    # smaller ratio and for negative ones the larger, so a single product with the advantages is needed
+    ratio = torch.exp(log_probs - old_log_probs)
+    clipped_ratio = torch.clamp(ratio, 1 - clip_range, 1 + clip_range)
+    pessimistic_ratio = torch.where(advantages >= 0, torch.minimum(ratio, clipped_ratio),
+                                    torch.maximum(ratio, clipped_ratio))
+    policy_loss = -(pessimistic_ratio * advantages).mean()
+
+    # Calculate value loss, squaring only the larger of the two errors
+    value_pred_clipped = old_values + torch.clamp(values - old_values, -clip_range, clip_range)
+    value_errors = values - returns
+    value_errors_clipped = value_pred_clipped - returns
+    value_loss = 0.5 * torch.where(value_errors.abs() >= value_errors_clipped.abs(), value_errors,
+                                   value_errors_clipped).pow(2).mean()
+
+    # Calculate total loss
+    loss = policy_loss + vf_coef * value_loss - ent_coef * entropy
+    return loss, policy_loss.detach(), value_loss.detach()
+
 
 class PPOAgent(Agent):
     """
@@ -24,6 +68,15 @@ class PPOAgent(Agent):
     :param action_dim: Number of possible actions
     :param config: Configuration reader instance
     :param device: Device to run the agent on
+    :param num_envs: Number of environments the agent interacts with, i.e. Environment.num_envs. Default is 1.
+
+    With training.inference_device = cpu and a CUDA device, act() runs on CPU copies of the actor, critic
+    and state normalizer, refreshed after every update, so that no device transfer happens per step.
+
+    With training.compile = true, networks and loss are compiled with torch.compile. Default is false.
+
+    With num_envs = N > 1 the agent acts on and stores batches of N states, one per environment
+    of a vector environment: states have shape (N, state_dim), actions, rewards and dones shape (N,).
 
     Usage:
         config = ConfigReader(config_dict)
@@ -59,30 +112,45 @@ class PPOAgent(Agent):
                  action_dim: int,
                  max_val: int,
                  config: ConfigReader,
-                 device: torch.device):
+                 device: torch.device,
+                 num_envs: int = 1):
         super().__init__()
+        # Read the whole configuration once
         seed = config.get_param('training.seed', v_type=int, default=42)
+        actor_hidden = ast.literal_eval(config.get_param('network.actor_hidden_sizes'))
+        critic_hidden = ast.literal_eval(config.get_param('network.critic_hidden_sizes'))
+        activation = config.get_param('network.activation')
+        lr = config.get_param('network.learning_rate', v_type=float)
+        gamma = config.get_param('ppo.gamma', v_type=float)
+        gae_lambda = config.get_param('ppo.gae_lambda', v_type=float, default=0.95)
+        clip_range = config.get_param('ppo.clip_range', v_type=float)
+        ent_coef = config.get_param('ppo.ent_coef', v_type=float)
+        vf_coef = config.get_param('ppo.vf_coef', v_type=float)
+        max_grad_norm = config.get_param('ppo.max_grad_norm', v_type=float)
+        buffer_size = config.get_param('training.buffer_size', v_type=int)
+        num_epochs = config.get_param('training.num_epochs', v_type=int)
+        batch_size = config.get_param('training.batch_size', v_type=int)
+        use_compile = config.get_param('training.compile', v_type=bool, default=False)
+        inference_device = torch.device(config.get_param('training.inference_device', v_type=str,
+                                                         default=str(device)))
+
         set_seed(seed)
         self.device = device
         self.state_normalizer = RunningNormalizer(state_dim, device)
 
-        # Get network configurations
-        actor_hidden = eval(config.get_param('network.actor_hidden_sizes'))
-        critic_hidden = eval(config.get_param('network.critic_hidden_sizes'))
-        activation = config.get_param('network.activation')
-        lr = float(config.get_param('network.learning_rate'))
-
-        # Get PPO parameters or default values
-        self.gamma = float(config.get_param('ppo.gamma'))
-        self.clip_range = float(config.get_param('ppo.clip_range'))
-        self.ent_coef = float(config.get_param('ppo.ent_coef'))
-        self.vf_coef = float(config.get_param('ppo.vf_coef'))
-        self.max_grad_norm = float(config.get_param('ppo.max_grad_norm'))
+        # PPO parameters
+        self.gamma = gamma
+        self.gae_lambda = gae_lambda
+        self.clip_range = clip_range
+        self.ent_coef = ent_coef
+        self.vf_coef = vf_coef
+        self.max_grad_norm = max_grad_norm
 
-        # Get training parameters
-        buffer_size = int(config.get_param('training.buffer_size'))
-        self.num_epochs = int(config.get_param('training.num_epochs'))
-        self.batch_size = int(config.get_param('training.batch_size'))
+        # Training parameters
+        self.num_epochs = num_epochs
+        self.batch_size = batch_size
+        self.num_envs = num_envs
+        self.inference_device = inference_device
 
         # Buffer handling
         self.minimum_required_samples = int(self.batch_size * 2) # threshold for buffer update
@@ -104,13 +172,46 @@ class PPOAgent(Agent):
             device=device
         )
 
-        # Initialize optimizers
-        self.actor_optimizer = optim.Adam(self.actor.parameters(), lr=lr)
-        self.critic_optimizer = optim.Adam(self.critic.parameters(), lr=lr)
+        # Networks used by act(). For a single small state the forwards take microseconds, less than the
+        # transfers to and from the device, so they can be mirrored on the CPU
+        if inference_device != device:
+            self._inference_actor = ActorNetwork(
+                input_dim=state_dim,
+                action_dim=action_dim,
+                hidden_sizes=actor_hidden,
+                activation=activation,
+                device=inference_device,
+                max_val=max_val
+            ).eval()
+            self._inference_critic = CriticNetwork(
+                input_dim=state_dim,
+                hidden_sizes=critic_hidden,
+                activation=activation,
+                device=inference_device
+            ).eval()
+            self._inference_normalizer = RunningNormalizer(state_dim, inference_device)
+            self._sync_inference_networks()
+        else:
+            self._inference_actor = self.actor
+            self._inference_critic = self.critic
+            self._inference_normalizer = self.state_normalizer
+
+        # Compile networks and loss when enabled with training.compile: small networks are dominated by per-op
+        # dispatch overhead, but compiling needs the inductor toolchain. Otherwise the loss is still scripted,
+        # so that its pointwise ops are fused.
+        if use_compile:
+            self.actor.compile(mode="reduce-overhead", fullgraph=True, dynamic=False)
+            self.critic.compile(mode="reduce-overhead", fullgraph=True, dynamic=False)
+            self._ppo_loss = torch.compile(_ppo_loss, fullgraph=True, dynamic=False)
+        else:
+            self._ppo_loss = torch.jit.script(_ppo_loss)
+
+        # Actor and critic are always updated together from a single loss, so they share one optimizer
+        self.networks = nn.ModuleDict({'actor': self.actor, 'critic': self.critic})
+        self.optimizer = optim.Adam(self.networks.parameters(), lr=lr, fused=device.type == 'cuda')
 
         # Scheduler
-        self.actor_scheduler = optim.lr_scheduler.StepLR(self.actor_optimizer, step_size=100, gamma=0.7)
-        self.critic_scheduler = optim.lr_scheduler.StepLR(self.critic_optimizer, step_size=100, gamma=0.7)
+        self.scheduler = optim.lr_scheduler.StepLR(self.optimizer, step_size=100, gamma=0.7)
 
         # Initialize buffer
         self.buffer = PPOBuffer(
@@ -119,29 +220,122 @@ class PPOAgent(Agent):
             device=device
         )
 
+        # Staging tensors reused for every per-step host to device transfer, allocated once with their exact
+        # size instead of going through the caching host allocator at every step
+        self._state_cpu = torch.empty((num_envs, state_dim), pin_memory=device.type == 'cuda')
+        self._state_gpu = torch.empty((num_envs, state_dim), device=device)
+
+        # CUDA graph of the acting step, captured lazily on the first call of act()
+        self._act_graph: Optional[torch.cuda.CUDAGraph] = None
+        self._act_action: Optional[torch.Tensor] = None
+        self._act_log_prob: Optional[torch.Tensor] = None
+        self._act_value: Optional[torch.Tensor] = None
+
+        # Staged device state (if any), log probability and value estimate of the act() calls not yet followed
+        # by their update(). A trainer may act on the next state before updating with the current transition,
+        # so up to two calls are pending.
+        self._pending_act: Deque[Tuple[Optional[torch.Tensor], torch.Tensor, torch.Tensor]] = deque(maxlen=2)
+
+    def _sync_inference_networks(self) -> None:
+        """
+        Copies the current weights and normalization statistics to the networks used by act(),
+        when they are mirrored on a different device.
+        """
+        if self._inference_actor is self.actor:
+            return
+        self._inference_actor.load_state_dict(self.actor.state_dict())
+        self._inference_critic.load_state_dict(self.critic.state_dict())
+        self._inference_normalizer.load_state_dict(self.state_normalizer.state_dict())
+
+    def _stage_state(self, state: np.ndarray) -> torch.Tensor:
+        """
+        Copies the environment states of one step to the device through the preallocated staging tensors.
+
+        :param state: Environment state of shape (state_dim,), or (num_envs, state_dim) for vector environments
+        :return: Device tensor of shape (num_envs, state_dim). It is overwritten by the next call.
+        """
+        self._state_cpu.copy_(torch.as_tensor(state).reshape(self._state_cpu.shape))
+        self._state_gpu.copy_(self._state_cpu, non_blocking=True)
+        return self._state_gpu
+
+    def _sample_action_eager(self, state_tensor: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        """
+        Normalizes the state, samples an action and estimates the state value with the uncompiled
+        actor and critic forwards, so that the whole step can be recorded in a CUDA graph.
+
+        :param state_tensor: Device state tensor of shape (num_envs, state_dim)
+        :return: Tuple of (sampled_action, log_probability, value)
+        """
+        normalized_state = self.state_normalizer.normalize(state_tensor)
+        logits = self.actor.forward(normalized_state)
+        dist = self.actor.distribution_from_logits(logits, validate_args=False)
+        action = dist.sample()
+        return action, dist.log_prob(action), self.critic.forward(normalized_state)
+
+    def _capture_act_graph(self) -> None:
+        """
+        Captures normalization, actor and critic forwards and sampling on the staging state tensor into a CUDA graph.
+        Replaying it replaces the per-step kernel launches with a single graph launch.
+        """
+        # Warm up on a side stream, as required before capturing
+        stream = torch.cuda.Stream(device=self.device)
+        stream.wait_stream(torch.cuda.current_stream(self.device))
+        with torch.cuda.stream(stream):
+            for _ in range(3):
+                self._sample_action_eager(self._state_gpu)
+        torch.cuda.current_stream(self.device).wait_stream(stream)
+
+        self._act_graph = torch.cuda.CUDAGraph()
+        with torch.cuda.graph(self._act_graph):
+            self._act_action, self._act_log_prob, self._act_value = self._sample_action_eager(self._state_gpu)
+
     def act(self, state: np.ndarray, explore: bool = True) -> np.ndarray:
         """
-        Select an action given the current state.
+        Select an action given the current state. When exploring, the log probability of the action and the
+        value estimate of the state are kept on the device for the update() call of this transition.
         
-        :param state: Current environment state
-        :param explore: Whether to explore (ignored in PPO as it always samples from policy)
-        :return: Selected action as numpy array
+        :param state: Current environment state, or batch of states for vector environments
+        :param explore: Whether the agent is training, so that update() follows. PPO always samples from the policy.
+        :return: Selected actions as numpy array of shape (num_envs,)
         """
-        state_tensor = torch.FloatTensor(state).unsqueeze(0).to(self.device)
+        with torch.inference_mode():
+            if self.inference_device.type == 'cuda':
+                # The staging tensor and the graph outputs are overwritten below: a pending call referencing
+                # them is copied first
+                if self._pending_act and self._pending_act[-1][0] is self._state_gpu:
+                    self._pending_act.append(tuple(tensor.clone() for tensor in self._pending_act.pop()))
+                self._stage_state(state)
+                if self._act_graph is None:
+                    self._capture_act_graph()
+                self._act_graph.replay()
+                if explore:
+                    self._pending_act.append((self._state_gpu, self._act_log_prob, self._act_value))
+                return self._act_action.cpu().numpy()
+
+            state_tensor = self._state_cpu.copy_(torch.as_tensor(state).reshape(self._state_cpu.shape))
+            if self.inference_device != self.device:
+                state_tensor = state_tensor.to(self.inference_device)
 
-        # Normalization
-        normalized_state = self.state_normalizer.normalize(state_tensor)
+            # Normalization
+            normalized_state = self._inference_normalizer.normalize(state_tensor)
+            action, log_prob = self._inference_actor.get_action_and_log_prob(normalized_state)
+            if explore:
+                self._pending_act.append((None, log_prob, self._inference_critic(normalized_state)))
+            return action.cpu().numpy()
 
-        with torch.no_grad():
-            action, _ = self.actor.get_action_and_log_prob(normalized_state)
-            action_out = action if isinstance(action, (int, float)) else action.cpu().numpy()
-            return action_out
+    def reset(self) -> None:
+        """Reset the agent's episode-specific variables, discarding the act() calls without an update()."""
+        super().reset()
+        self._pending_act.clear()
 
     def update(self, state: np.ndarray, action: np.ndarray, reward: float, next_state: np.ndarray, done: bool) -> Dict[
         str, float]:
         """
         Store transition in buffer and update networks if episode is done.
-        
+        For vector environments all arguments are batched, one entry per environment.
+        The action must be the one returned by the oldest exploring act() call without its update(), usually the
+        last one, whose log probability and value are stored. At most one act() call can happen in between.
+
         :param state: Current state
         :param action: Action taken
         :param reward: Reward received
@@ -149,34 +343,21 @@ class PPOAgent(Agent):
         :param done: Whether episode terminated
         :return: Dictionary of training metrics if update performed, empty dict otherwise
         """
-        # Store the transition inside the buffer
-        with torch.no_grad():
-            state_tensor = torch.FloatTensor(state).unsqueeze(0).to(self.device)
-
-            # Normalization
-            self.state_normalizer.update(state_tensor)
-            normalized_state = self.state_normalizer.normalize(state_tensor)
-
-            value = self.critic(normalized_state)
-
-            # Convert action to tensor for log prob calculation
-            action_tensor = torch.FloatTensor([action]) if isinstance(action, (int, float)) else torch.FloatTensor(action)
-            action_tensor = action_tensor.to(self.device)
-            _, log_prob = self.actor.get_action_and_log_prob(normalized_state)
-            log_prob = log_prob.cpu().numpy().item()
-
-            # Store transition in buffer
-            self.buffer.store(
-                state=state,
-                action=action,
-                reward=reward,
-                value=value.cpu().numpy().item(),
-                log_prob=log_prob,
-                done=done
-            )
+        # Store the transition inside the buffer. When acting on the device, act() already staged the state
+        # there, so it is copied on the device instead of being transferred again from pageable memory
+        staged_state, log_prob, value = self._pending_act.popleft()
+        self.buffer.store(
+            state=staged_state if staged_state is not None else state,
+            action=action,
+            reward=reward,
+            value=value,
+            log_prob=log_prob,
+            done=done
+        )
 
-        # If episode is done perform PPO update
-        if done and len(self.buffer) >= self.minimum_required_samples:
+        # If an episode is done, or the buffer cannot hold another step, perform PPO update
+        buffer_full = len(self.buffer) + self.num_envs > self.buffer.size
+        if (np.any(done) or buffer_full) and len(self.buffer) >= self.minimum_required_samples:
             print(f"Episode ended with {len(self.buffer)} samples in buffer")
             metrics = self.update_networks(next_state)
             return metrics
@@ -191,128 +372,127 @@ class PPOAgent(Agent):
         :return: Dictionary containing update metrics
         """
         data = self.buffer.get()
+        n = len(self.buffer)
+        device = self.device
 
-        # Normalization
-        states = data['states'] if torch.is_tensor(data['states']) else torch.FloatTensor(data['states']).to(self.device)
-        normalized_states = self.state_normalizer.normalize(states)
+        # Normalized with the statistics used by act() during the rollout, the same inputs that produced
+        # the old log probabilities and values
+        normalized_states = self.state_normalizer.normalize(data['states'])
 
-        total_policy_loss = 0
-        total_value_loss = 0
-        total_entropy = 0
+        # Minibatch metrics are accumulated on the device and synchronized once at the end of the update:
+        # policy_loss, value_loss, entropy, value_mean, value_std
+        stats = torch.zeros(5, device=device)
         update_count = 0
-        total_value_mean = 0
-        total_value_std = 0
-        total_advantage_mean = 0
-        total_advantage_std = 0
 
-        for _ in range(self.num_epochs):
-            indices = torch.randperm(len(self.buffer))
+        # Calculate advantages and returns once for the whole buffer
+        with torch.no_grad():
+            final_state_tensor = self._stage_state(final_state)
+            normalized_final_state = self.state_normalizer.normalize(final_state_tensor)
+            final_value = self.critic(normalized_final_state)
+            # Transitions are stored step by step, one per environment: view them as (steps, num_envs)
+            buffer_values = data['values'].view(-1, self.num_envs)
+            next_values = torch.cat([buffer_values[1:], final_value.unsqueeze(0)])
+            all_advantages, all_returns = self._compute_gae_vec(
+                rewards=data['normalized_rewards'].view(-1, self.num_envs),
+                values=buffer_values,
+                next_values=next_values,
+                dones=data['dones'].view(-1, self.num_envs).float(),
+                gamma=self.gamma,
+                lam=self.gae_lambda
+            )
+            all_advantages = all_advantages.flatten()
+            all_returns = all_returns.flatten()
+
+            # Normalize advantages once for the whole buffer, keeping the raw statistics for the metrics
+            advantage_stats = torch.stack([all_advantages.mean(), all_advantages.std()])
+            all_advantages = (all_advantages - advantage_stats[0]) / (advantage_stats[1] + 1e-8)
 
-            for start in range(0, len(self.buffer), current_batch_size):
-                end = min(start + current_batch_size, len(self.buffer))
-                if end - start < current_batch_size * 0.8:   # skip if batch size too small
-                    continue
+        # The last batch is padded with samples from the start of the permutation to keep a fixed batch shape
+        num_batches = -(-n // current_batch_size)
+        padding = num_batches * current_batch_size - n
 
+        for _ in range(self.num_epochs):
+            indices = torch.randperm(n, device=device)
+            if padding > 0:
+                indices = torch.cat([indices, indices[:padding]])
+
+            for start in range(0, num_batches * current_batch_size, current_batch_size):
                 update_count += 1
-                batch_indices = indices[start:end]
+                batch_indices = indices[start:start + current_batch_size]
 
                 # Get batch data
-                states = normalized_states[batch_indices]
+                mb_states = normalized_states[batch_indices]
                 actions = data['actions'][batch_indices]
                 old_values = data['values'][batch_indices]
                 old_log_probs = data['log_probs'][batch_indices]
-                rewards = data['normalized_rewards'][batch_indices]
-                dones = data['dones'][batch_indices]
+                advantages = all_advantages[batch_indices]
+                returns = all_returns[batch_indices]
 
-                # Get current policy distribution and value estimates
-                action_distribution = self.actor.get_distribution(normalized_states[batch_indices])
-                values = self.critic(normalized_states[batch_indices])
-                log_probs = action_distribution.log_prob(actions)
-                entropy = action_distribution.entropy().mean()
+                # Get current policy log probabilities and value estimates.
+                # A single log-softmax gives both the action log probabilities and the entropy.
+                log_probs_all = F.log_softmax(self.actor(mb_states), dim=-1)
+                values = self.critic(mb_states)
+                log_probs = log_probs_all.gather(-1, actions.unsqueeze(-1)).squeeze(-1)
+                entropy = -(log_probs_all.exp() * log_probs_all).sum(-1).mean()
 
-                # Calculate advantages and returns
-                with torch.no_grad():
-                    final_state_tensor = torch.FloatTensor(final_state).unsqueeze(0).to(self.device)
-                    normalized_final_state = self.state_normalizer.normalize(final_state_tensor)
-                    final_value = self.critic(normalized_final_state)
-                    next_values = torch.zeros_like(values)
-                    next_values[:-1] = values[1:].clone()
-                    next_values[-1] = final_value
-
-                    # Calculate advantages
-                    advantages, returns = self.buffer.compute_gae(
-                        rewards=rewards.cpu().numpy(),
-                        values=values.cpu().numpy(),
-                        dones=dones.cpu().numpy(),
-                        next_value=final_value.item(),
-                        gamma=self.gamma
-                    )
-                    advantages = torch.FloatTensor(advantages).to(self.device)
-                    returns = torch.FloatTensor(returns).to(self.device)
-
-                    # Track advantage statistics
-                    total_advantage_mean += advantages.mean().item()
-                    total_advantage_std += advantages.std().item()
-                    total_value_mean += values.mean().item()
-                    total_value_std += values.std().item()
-
-                # Calculate policy loss with clipping
-                ratio = torch.exp(log_probs - old_log_probs)
-                policy_loss_1 = ratio * advantages
-                policy_loss_2 = torch.clamp(ratio, 1 - self.clip_range, 1 + self.clip_range) * advantages
-                policy_loss = -torch.min(policy_loss_1, policy_loss_2).mean()
-
-                # Calculate value loss
-                value_pred_clipped = old_values + torch.clamp(values - old_values, -self.clip_range, self.clip_range)
-                value_losses = (values - returns).pow(2)
-                value_losses_clipped = (value_pred_clipped - returns).pow(2)
-                value_loss = 0.5 * torch.max(value_losses, value_losses_clipped).mean()
-
-                # Calculate total loss
-                loss = policy_loss + self.vf_coef * value_loss - self.ent_coef * entropy
+                loss, policy_loss, value_loss = self._ppo_loss(
+                    log_probs, old_log_probs, advantages, values, old_values, returns,
+                    self.clip_range, self.vf_coef, self.ent_coef, entropy
+                )
 
                 # Optimize
-                self.actor_optimizer.zero_grad()
-                self.critic_optimizer.zero_grad()
+                self.optimizer.zero_grad(set_to_none=True)
                 loss.backward()
+                torch.nn.utils.clip_grad_norm_(self.networks.parameters(), self.max_grad_norm)
+                self.optimizer.step()
 
-                # Clip gradients
-                torch.nn.utils.clip_grad_norm_(self.actor.parameters(), self.max_grad_norm)
-                torch.nn.utils.clip_grad_norm_(self.critic.parameters(), self.max_grad_norm)
-
-                self.actor_optimizer.step()
-                self.critic_optimizer.step()
-
-                total_policy_loss += policy_loss.item()
-                total_value_loss += value_loss.item()
-                total_entropy += entropy.item()
-
-            if update_count == 0:
-                return {
-                    'policy_loss': 0.0,
-                    'value_loss': 0.0,
-                    'entropy': 0.0,
-                    'batch_size_used': current_batch_size,
-                    'updates_performed': 0,
-                    'value_mean': 0.0,
-                    'value_std': 0.0,
-                    'advantage_mean': 0.0,
-                    'advantage_std': 0.0,
-                    'learning_rate': self.actor_optimizer.param_groups[0]['lr']
-                }
+                with torch.no_grad():
+                    stats += torch.stack([policy_loss, value_loss, entropy, values.mean(), values.std()])
 
-            return {
-                'policy_loss': total_policy_loss / update_count,
-                'value_loss': total_value_loss / update_count,
-                'entropy': total_entropy / update_count,
-                'batch_size_used': current_batch_size,
-                'updates_performed': update_count,
-                'value_mean': total_value_mean / update_count,
-                'value_std': total_value_std / update_count,
-                'advantage_mean': total_value_mean / update_count,
-                'advantage_std': total_advantage_std / update_count,
-                'learning_rate': self.actor_optimizer.param_groups[0]['lr']
-            }
+        policy_loss, value_loss, entropy, value_mean, value_std, advantage_mean, advantage_std = (
+            torch.cat([stats / update_count, advantage_stats]).tolist()
+        )
+        return {
+            'policy_loss': policy_loss,
+            'value_loss': value_loss,
+            'entropy': entropy,
+            'batch_size_used': current_batch_size,
+            'updates_performed': update_count,
+            'value_mean': value_mean,
+            'value_std': value_std,
+            'advantage_mean': advantage_mean,
+            'advantage_std': advantage_std,
+            'learning_rate': self.optimizer.param_groups[0]['lr']
+        }
+
+    @staticmethod
+    def _compute_gae_vec(rewards: torch.Tensor, values: torch.Tensor, next_values: torch.Tensor,
+                         dones: torch.Tensor, gamma: float, lam: float) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Computes Generalized Advantage Estimation on the device of the given tensors.
+        The temporal differences are computed in a single vectorized pass, then accumulated
+        with a backward scan over time, vectorized across environments, without leaving the device.
+
+        :param rewards: Rewards tensor of shape (T,) or (T, num_envs)
+        :param values: Value estimates tensor of the same shape as rewards
+        :param next_values: Value estimates of the next states, tensor of the same shape as rewards
+        :param dones: Termination flags as float tensor of the same shape as rewards
+        :param gamma: Discount factor
+        :param lam: GAE lambda parameter
+        :return: Tuple of (advantages, returns), both of the same shape as rewards
+        """
+        not_dones = 1.0 - dones
+        deltas = rewards + gamma * not_dones * next_values - values
+        discounts = gamma * lam * not_dones
+
+        advantages = torch.empty_like(deltas)
+        last_gae = torch.zeros_like(deltas[0])
+        for t in range(deltas.shape[0] - 1, -1, -1):
+            last_gae = deltas[t] + discounts[t] * last_gae
+            advantages[t] = last_gae
+
+        returns = advantages + values
+        return advantages, returns
 
     def update_networks(self, final_state: np.ndarray) -> Dict[str, float]:
         if len(self.buffer) < self.minimum_required_samples:
@@ -326,35 +506,147 @@ class PPOAgent(Agent):
 
         adjusted_batch_size = min(self.batch_size, len(self.buffer))
         metrics = self._perform_update(final_state, adjusted_batch_size)
-        self.actor_scheduler.step()
-        self.critic_scheduler.step()
+        # The statistics are updated once with all the states collected since the last update
+        self.state_normalizer.update(self.buffer.get()['states'])
+        self.scheduler.step()
         self.buffer.clear()
+        self._sync_inference_networks()
         return metrics
 
+    def state_dict(self) -> Dict[str, Any]:
+        """
+        Gets the complete state of the agent, so that a trainer can store it inside its own checkpoint.
+        Like torch state dicts, the returned tensors are the live ones and are not copied.
+
+        :return: Dictionary with weights, normalization statistics, optimizer and scheduler states
+        """
+        return {
+            'actor_state_dict': self.actor.state_dict(),
+            'critic_state_dict': self.critic.state_dict(),
+            'state_normalizer': self.state_normalizer.state_dict(),
+            'optimizer_state_dict': self.optimizer.state_dict(),
+            'scheduler_state_dict': self.scheduler.state_dict()
+        }
+
+    def load_state_dict(self, state_dict: Dict[str, Any]) -> None:
+        """
+        Loads a state returned by state_dict().
+
+        :param state_dict: The state of the agent, its tensors can be on any device
+        """
+        self.actor.load_state_dict(state_dict['actor_state_dict'])
+        self.critic.load_state_dict(state_dict['critic_state_dict'])
+        self.state_normalizer.load_state_dict(state_dict['state_normalizer'])
+        self.optimizer.load_state_dict(state_dict['optimizer_state_dict'])
+        self.scheduler.load_state_dict(state_dict['scheduler_state_dict'])
+        self._sync_inference_networks()
+
     def save(self, path: str) -> None:
         """
         Save agent networks.
+        Weights and normalization statistics are written to a safetensors file at the given path, while
+        the optimizer and scheduler states, which safetensors cannot hold, go to a companion ".opt.pt" file.
 
         :param path: Path to save the model
         """
+        tensors = {f"actor.{k}": v for k, v in self.actor.state_dict().items()}
+        tensors.update({f"critic.{k}": v for k, v in self.critic.state_dict().items()})
+        normalizer_state = self.state_normalizer.state_dict()
+        tensors.update({
+            'state_normalizer.mean': normalizer_state['mean'],
+            'state_normalizer.std': normalizer_state['std'],
+            'state_normalizer.count': torch.tensor(normalizer_state['count'], dtype=torch.float64)
+        })
+        save_file(tensors, path)
         torch.save({
-            'actor_state_dict': self.actor.state_dict(),
-            'critic_state_dict': self.critic.state_dict(),
-            'actor_optimizer_state_dict': self.actor_optimizer.state_dict(),
-            'critic_optimizer_state_dict': self.critic_optimizer.state_dict(),
-            'state_normalizer': self.state_normalizer.state_dict()
-        }, path)
+            'optimizer_state_dict': self.optimizer.state_dict(),
+            'scheduler_state_dict': self.scheduler.state_dict()
+        }, self._optimizer_path(path))
 
     def load(self, path: str) -> None:
         """
-        Load agent networks.
+        Load agent networks. Checkpoints saved with torch.save by previous versions are also supported.
         
         :param path: Path to load the model
         """
-        checkpoint = torch.load(path)
+        try:
+            tensors = load_file(path, device=str(self.device))
+        except SafetensorError:
+            self._load_legacy(path)
+        else:
+            self.actor.load_state_dict(self._with_prefix(tensors, 'actor.'))
+            self.critic.load_state_dict(self._with_prefix(tensors, 'critic.'))
+            self.state_normalizer.load_state_dict({
+                'mean': tensors['state_normalizer.mean'],
+                'std': tensors['state_normalizer.std'],
+                'count': tensors['state_normalizer.count'].item()
+            })
+            optimizer_path = self._optimizer_path(path)
+            if optimizer_path.exists():
+                checkpoint = torch.load(optimizer_path, map_location=self.device)
+                self.optimizer.load_state_dict(checkpoint['optimizer_state_dict'])
+                self.scheduler.load_state_dict(checkpoint['scheduler_state_dict'])
+        self._sync_inference_networks()
+
+    def _load_legacy(self, path: str) -> None:
+        """
+        Load agent networks from a checkpoint saved with torch.save.
+
+        :param path: Path to load the model
+        """
+        checkpoint = torch.load(path, map_location=self.device)
         self.actor.load_state_dict(checkpoint['actor_state_dict'])
         self.critic.load_state_dict(checkpoint['critic_state_dict'])
-        self.actor_optimizer.load_state_dict(checkpoint['actor_optimizer_state_dict'])
-        self.critic_optimizer.load_state_dict(checkpoint['critic_optimizer_state_dict'])
+        if 'optimizer_state_dict' in checkpoint:
+            self.optimizer.load_state_dict(checkpoint['optimizer_state_dict'])
+            self.scheduler.load_state_dict(checkpoint['scheduler_state_dict'])
+        elif 'actor_optimizer_state_dict' in checkpoint:
+            self._load_split_optimizer_states(checkpoint['actor_optimizer_state_dict'],
+                                              checkpoint['critic_optimizer_state_dict'])
         if 'state_normalizer' in checkpoint:
             self.state_normalizer.load_state_dict(checkpoint['state_normalizer'])
+
+    def _load_split_optimizer_states(self, actor_state: Dict[str, Any], critic_state: Dict[str, Any]) -> None:
+        """
+        Load the states of the separate actor and critic optimizers of previous versions into the shared optimizer,
+        whose parameters are the actor ones followed by the critic ones.
+        The learning rate is restored, while the scheduler restarts counting its steps from the loaded rate.
+
+        :param actor_state: State of the actor optimizer
+        :param critic_state: State of the critic optimizer
+        """
+        num_actor_params = len(list(self.actor.parameters()))
+        num_critic_params = len(list(self.critic.parameters()))
+        (actor_group,), (critic_group,) = actor_state['param_groups'], critic_state['param_groups']
+        if len(actor_group['params']) != num_actor_params or len(critic_group['params']) != num_critic_params:
+            warnings.warn("The optimizer states of the checkpoint do not match the networks, "
+                          "the optimizer starts from scratch")
+            return
+
+        state = {actor_group['params'].index(i): value for i, value in actor_state['state'].items()}
+        state.update({num_actor_params + critic_group['params'].index(i): value
+                      for i, value in critic_state['state'].items()})
+        param_group = self.optimizer.state_dict()['param_groups'][0]
+        param_group.update({key: actor_group[key] for key in ('lr', 'initial_lr') if key in actor_group})
+        self.optimizer.load_state_dict({'state': state, 'param_groups': [param_group]})
+
+    @staticmethod
+    def _optimizer_path(path: str | Path) -> Path:
+        """
+        Computes the path of the optimizer state file that accompanies a weights file.
+
+        :param path: Path of the weights file
+        :return: Path of the optimizer state file
+        """
+        return Path(path).with_suffix('.opt.pt')
+
+    @staticmethod
+    def _with_prefix(tensors: Dict[str, torch.Tensor], prefix: str) -> Dict[str, torch.Tensor]:
+        """
+        Extracts the tensors whose name starts with the given prefix, removing the prefix.
+
+        :param tensors: Flat dictionary of named tensors
+        :param prefix: Prefix to select
+        :return: State dict with the selected tensors
+        """
+        return {k[len(prefix):]: v for k, v in tensors.items() if k.startswith(prefix)}
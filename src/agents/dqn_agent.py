@@ -83,6 +83,9 @@ class DQNAgent(Agent):
         self.q_network = QNetwork(self.state_dim, self.num_actions, hidden_dim).to(self.device)
         self.target_network = QNetwork(self.state_dim, self.num_actions, hidden_dim).to(self.device)
         self.target_network.load_state_dict(self.q_network.state_dict())
+        # Staging tensors reused for the host to device transfer of the state at every act()
+        self._state_cpu = torch.empty((1, self.state_dim), pin_memory=self.device.type == 'cuda')
+        self._state_gpu = torch.empty((1, self.state_dim), device=self.device)
 
         # Setup optimizer
         self.optimizer = optim.Adam(self.q_network.parameters(), lr=learning_rate)
@@ -114,9 +117,10 @@ class DQNAgent(Agent):
         if explore and random.random() < self.epsilon:
             action = random.randrange(self.num_actions)
         else:
-            with torch.no_grad():
-                state_tensor = torch.FloatTensor(state).unsqueeze(0).to(self.device)
-                q_values = self.q_network(state_tensor)
+            with torch.inference_mode():
+                self._state_cpu.copy_(torch.as_tensor(state).reshape(self._state_cpu.shape))
+                self._state_gpu.copy_(self._state_cpu, non_blocking=True)
+                q_values = self.q_network(self._state_gpu)
                 action = torch.argmax(q_values).item()
 
         # Return action as numpy array to match interface
@@ -136,7 +140,31 @@ class DQNAgent(Agent):
         """
         # Store experience in replay buffer (convert action array to integer)
         self.replay_buffer.push(state, action[0], reward, next_state, done)
+        return self._optimize()
 
+    def update_batch(self, states: np.ndarray, actions: np.ndarray, rewards: np.ndarray,
+                     next_states: np.ndarray, dones: np.ndarray) -> Dict[str, float]:
+        """
+        Update the agent's policy based on a batch of consecutive transitions.
+        All the transitions are stored in the replay buffer, then a single optimization step is done.
+
+        :param states: Current states, of shape (batch_size, state_dim)
+        :param actions: Actions taken, of shape (batch_size, 1)
+        :param rewards: Rewards received, of shape (batch_size,)
+        :param next_states: Next states, of shape (batch_size, state_dim)
+        :param dones: Whether each episode terminated, of shape (batch_size,)
+        :return Dictionary of training metrics
+        """
+        for state, action, reward, next_state, done in zip(states, actions[:, 0], rewards, next_states, dones):
+            self.replay_buffer.push(state, action, reward, next_state, done)
+        return self._optimize()
+
+    def _optimize(self) -> Dict[str, float]:
+        """
+        Do an optimization step of the Q network on a batch sampled from the replay buffer.
+
+        :return Dictionary of training metrics
+        """
         # Only update if we have enough samples
         if len(self.replay_buffer) < self.batch_size:
             return {"loss": 0.0, "epsilon": self.epsilon, "avg_q_value": 0.0}
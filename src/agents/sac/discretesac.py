@@ -58,6 +58,9 @@ class DiscreteSAC(object):
         hard_update(self.critic_target, self.critic)
 
         self._setup_policy(num_inputs, action_space, lr, hidden_size)
+        # Staging tensors reused for the host to device transfer of the state at every select_action()
+        self._state_cpu = torch.empty((1, num_inputs), pin_memory=self.device.type == 'cuda')
+        self._state_gpu = torch.empty((1, num_inputs), device=self.device)
 
     def _setup_policy(self, num_inputs: int, action_space: Discrete, lr: float, hidden_size: int):
         if self.automatic_entropy_tuning is True:
@@ -82,9 +85,11 @@ class DiscreteSAC(object):
         :param evaluate: Whether to evaluate deterministically or sample from policy
         :return: Selected action
         """
-        state = torch.FloatTensor(state).to(self.device).unsqueeze(0)
-        action, _, _ = self.policy.sample(state, evaluate)
-        return action.detach().cpu().numpy()[0]
+        with torch.inference_mode():
+            self._state_cpu.copy_(torch.as_tensor(state).reshape(self._state_cpu.shape))
+            self._state_gpu.copy_(self._state_cpu, non_blocking=True)
+            action, _, _ = self.policy.sample(self._state_gpu, evaluate)
+        return action.cpu().numpy()[0]
 
     def update_parameters(self, memory: ReplayMemory, batch_size: int, updates: int) -> Tuple[
         float, float, float, float, float]:
@@ -23,8 +23,9 @@ class RunningNormalizer:
         M2 = m_a + m_b + delta ** 2 * self.count * batch_size / tot_count
         new_std = torch.sqrt(M2 / tot_count)
 
-        self.mean = new_mean
-        self.std = new_std
+        # Updated in place so that captured CUDA graphs keep reading the current statistics
+        self.mean.copy_(new_mean)
+        self.std.copy_(new_std)
         self.count = tot_count
 
     def normalize(self, x):
@@ -38,6 +39,6 @@ class RunningNormalizer:
         }
 
     def load_state_dict(self, state_dict):
-        self.mean = state_dict['mean'].to(self.device)
-        self.std = state_dict['std'].to(self.device)
+        self.mean.copy_(state_dict['mean'])
+        self.std.copy_(state_dict['std'])
         self.count = state_dict['count']
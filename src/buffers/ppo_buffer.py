@@ -38,14 +38,14 @@ class PPOBuffer:
     def __init__(self, size: int, state_dim: int, device: torch.device):
         self.device = device
 
-        # Core storage
-        self.states = np.zeros((size, state_dim), dtype=np.float32)
-        self.actions = np.zeros(size, dtype=np.int32)               # Discrete actions
-        self.values = np.zeros(size, dtype=np.float32)
-        self.log_probs = np.zeros(size, dtype=np.float32)
-        self.dones = np.zeros(size, dtype=np.bool_)
-        self.raw_rewards = np.zeros(size, dtype=np.float32)
-        self.normalized_rewards = np.zeros(size, dtype=np.float32)
+        # Core storage, preallocated on the device and written in place so that get() needs no conversion
+        self.states = torch.zeros((size, state_dim), device=device)
+        self.actions = torch.zeros(size, dtype=torch.long, device=device)  # Discrete actions
+        self.values = torch.zeros(size, device=device)
+        self.log_probs = torch.zeros(size, device=device)
+        self.dones = torch.zeros(size, dtype=torch.bool, device=device)
+        self.raw_rewards = torch.zeros(size, device=device)
+        self.normalized_rewards = torch.zeros(size, device=device)
         
         self.size = size
         self.ptr = 0             # Current insertion pointer
@@ -55,6 +55,13 @@ class PPOBuffer:
         self.epsilon = 1e-8
         self.reward_var = 0
 
+        # On CUDA the per-step fields are packed into a pinned host tensor, reused at every step and copied to
+        # the device with a single asynchronous transfer. Rows are action, raw reward, normalized reward, done
+        # and then the state, so that the first four are contiguous when the state is already on the device.
+        self._staging_host = None
+        self._staging_device = None
+        self._staging_copied = torch.cuda.Event() if device.type == 'cuda' else None
+
     def update_reward_stats(self, reward: float):
         self.reward_count += 1
         delta = reward - self.reward_mean
@@ -66,11 +73,13 @@ class PPOBuffer:
         normalized = (reward - self.reward_mean) / (self.reward_std + self.epsilon)
         return np.clip(normalized, -10.0, 10.0)
 
-    def store(self, state: np.ndarray, action: int, reward: float, value: float, log_prob: float, done: bool) -> None:
+    def store(self, state: np.ndarray, action: int | np.ndarray, reward: float | np.ndarray,
+              value: float | torch.Tensor, log_prob: float | torch.Tensor, done: bool | np.ndarray) -> None:
         """
-        Store a transition in the buffer.
+        Store a transition in the buffer. With batched arguments, one transition per environment
+        of a vector environment is stored, in environment order.
         
-        :param state: Environment state/observation
+        :param state: Environment state/observation, of shape (state_dim,) or (num_envs, state_dim)
         :param action: Action taken
         :param reward: Reward received
         :param value: Value estimate
@@ -78,20 +87,68 @@ class PPOBuffer:
         :param done: Whether the episode has terminated
         :raises ValueError: If the buffer is full
         """
-        if self.ptr >= self.size:
+        rewards = np.atleast_1d(reward)
+        n = len(rewards)
+        if self.ptr + n > self.size:
             raise ValueError("Buffer is full. Call get() and clear() before adding more.")
-
-        self.update_reward_stats(reward)
-        self.raw_rewards[self.ptr] = reward
-        self.normalized_rewards[self.ptr] = self.normalize_reward(reward)
-
-        self.states[self.ptr] = state
-        self.actions[self.ptr] = action
-        self.values[self.ptr] = value
-        self.log_probs[self.ptr] = log_prob
-        self.dones[self.ptr] = done
-
-        self.ptr += 1
+        end = self.ptr + n
+
+        normalized_rewards = np.empty(n, dtype=np.float32)
+        for i, r in enumerate(rewards):
+            self.update_reward_stats(r)
+            normalized_rewards[i] = self.normalize_reward(r)
+        if self._staging_copied is not None:
+            self._store_staged(state, action, rewards, normalized_rewards, done)
+        else:
+            self.normalized_rewards[self.ptr:end] = torch.from_numpy(normalized_rewards)
+            self.raw_rewards[self.ptr:end] = torch.as_tensor(rewards, dtype=torch.float32)
+            self.states[self.ptr:end] = torch.as_tensor(state, dtype=torch.float32).reshape(n, -1)
+            self.actions[self.ptr:end] = torch.as_tensor(action).reshape(n)
+            self.dones[self.ptr:end] = torch.as_tensor(done).reshape(n)
+        self.values[self.ptr:end] = value
+        self.log_probs[self.ptr:end] = log_prob
+
+        self.ptr = end
+
+    def _store_staged(self, state: np.ndarray | torch.Tensor, action: int | np.ndarray, rewards: np.ndarray,
+                      normalized_rewards: np.ndarray, done: bool | np.ndarray) -> None:
+        """
+        Store the per-step fields of the transitions at the insertion pointer through the pinned staging tensor,
+        with a single non-blocking transfer, then scatter them on the device.
+
+        :param state: Environment states, already on the device when staged there by the agent
+        :param action: Actions taken
+        :param rewards: Raw rewards, one per transition
+        :param normalized_rewards: Normalized rewards, one per transition
+        :param done: Whether the episodes have terminated
+        """
+        n = len(rewards)
+        end = self.ptr + n
+        if self._staging_host is None or self._staging_host.shape[1] != n:
+            rows = 4 + self.states.shape[1]
+            self._staging_host = torch.empty((rows, n), pin_memory=True)
+            self._staging_device = torch.empty((rows, n), device=self.device)
+        state_on_device = isinstance(state, torch.Tensor) and state.device == self.device
+        rows = 4 if state_on_device else len(self._staging_host)
+
+        # The previous transfer must be complete before its host memory is overwritten
+        self._staging_copied.synchronize()
+        host = self._staging_host
+        host[0] = torch.as_tensor(action).reshape(n)
+        host[1] = torch.from_numpy(rewards.astype(np.float32, copy=False))
+        host[2] = torch.from_numpy(normalized_rewards)
+        host[3] = torch.as_tensor(done).reshape(n)
+        if not state_on_device:
+            host[4:] = torch.as_tensor(state, dtype=torch.float32).reshape(n, -1).T
+        staged = self._staging_device[:rows]
+        staged.copy_(host[:rows], non_blocking=True)
+        self._staging_copied.record()
+
+        self.actions[self.ptr:end] = staged[0]
+        self.raw_rewards[self.ptr:end] = staged[1]
+        self.normalized_rewards[self.ptr:end] = staged[2]
+        self.dones[self.ptr:end] = staged[3]
+        self.states[self.ptr:end] = state.reshape(n, -1) if state_on_device else staged[4:].T
 
     def clear(self) -> None:
         """Clear the buffer."""
@@ -99,7 +156,8 @@ class PPOBuffer:
 
     def get(self) -> Dict[str, torch.Tensor]:
         """
-        Get all stored data as tensors on the correct device.
+        Get all stored data as tensors on the correct device. The tensors are views of the buffer
+        storage, so they are only valid until the buffer is cleared and filled again.
         
         :return: Dictionary containing all buffer data
         :raises ValueError: If the buffer is empty
@@ -107,15 +165,14 @@ class PPOBuffer:
         if self.ptr == 0:
             raise ValueError("Buffer is empty.")
         
-        # Convert everything to tensors
         data = dict(
-            states=torch.as_tensor(self.states[:self.ptr], device=self.device),
-            actions=torch.as_tensor(self.actions[:self.ptr], device=self.device),
-            normalized_rewards=torch.as_tensor(self.normalized_rewards[:self.ptr], device=self.device),
-            raw_rewards=torch.as_tensor(self.raw_rewards[:self.ptr], device=self.device),
-            values=torch.as_tensor(self.values[:self.ptr], device=self.device),
-            log_probs=torch.as_tensor(self.log_probs[:self.ptr], device=self.device),
-            dones=torch.as_tensor(self.dones[:self.ptr], device=self.device)
+            states=self.states[:self.ptr],
+            actions=self.actions[:self.ptr],
+            normalized_rewards=self.normalized_rewards[:self.ptr],
+            raw_rewards=self.raw_rewards[:self.ptr],
+            values=self.values[:self.ptr],
+            log_probs=self.log_probs[:self.ptr],
+            dones=self.dones[:self.ptr]
         )
 
         return data
@@ -127,20 +184,3 @@ class PPOBuffer:
         :return: Number of transitions stored
         """
         return self.ptr
-
-    def compute_gae(self, rewards: np.ndarray, values: np.ndarray, dones: np.ndarray, next_value: float,
-                    gamma: float = 0.99, gae_lambda: float = 0.95) -> np.ndarray:
-        advantages = np.zeros_like(rewards)
-        last_gae = 0
-
-        for t in reversed(range(len(rewards))):
-            if t == len(rewards) - 1:
-                next_val = next_value
-            else:
-                next_val = values[t + 1]
-
-            delta = rewards[t] + gamma * next_val * (1 - dones[t]) - values[t]
-            advantages[t] = last_gae = delta + gamma * gae_lambda * (1 - dones[t]) * last_gae
-
-        returns = advantages + values
-        return advantages, returns
\ No newline at end of file
@@ -89,6 +89,21 @@ class Environment:
         """
         pass
 
+    def state_dict(self) -> Dict[str, Any]:
+        """
+        Gets the environment current state, so that a trainer can store it inside its own checkpoint. Optional.
+        :return: the state of the environment, empty by default.
+        """
+        return {}
+
+    def load_state_dict(self, state_dict: Dict[str, Any]):
+        """
+        Loads the environment state returned by state_dict(). Optional.
+        :param state_dict: the state of the environment.
+        :raises ValueError: If the state is not in the right format.
+        """
+        pass
+
     # Enviroment exploration methods
 
     def reset(self) -> Union[Tuple[Union[numpy.ndarray, torch.Tensor], Dict[str, Any]],Tuple[Union[numpy.ndarray, torch.Tensor]]]:
@@ -122,6 +137,24 @@ class Environment:
             observation = torch.tensor(observation, dtype=torch.float32, device=self.device)
         return observation, reward, done, truncated, info
 
+    def step_async(self, action: numpy.ndarray) -> None:
+        """
+        Starts stepping the sub-environments of a vector environment, without waiting for the results\
+        :param action: The batch of actions to take, one per sub-environment
+        """
+        self.env.step_async(action)
+
+    def step_wait(self) -> tuple[Any, numpy.ndarray, numpy.ndarray, numpy.ndarray, dict[str, Any]]:
+        """
+        Waits for the step started with step_async()\
+        :return: A tuple containing the batched (observation, reward, terminated, truncated, info).
+         Observation is tensor if use_tensor=True, numpy array otherwise
+        """
+        observation, reward, done, truncated, info = self.env.step_wait()
+        if self.use_tensor:
+            observation = torch.tensor(observation, dtype=torch.float32, device=self.device)
+        return observation, reward, done, truncated, info
+
     def sample_action(self) -> Union[numpy.ndarray, torch.Tensor]:
         """
         Samples a random action from the environment's action space\
@@ -150,5 +183,19 @@ class Environment:
         """
         return self.env.action_space
 
+    @property
+    def num_envs(self) -> int:
+        """
+        Gets the number of parallel environments\
+        :return: The number of sub-environments if the environment is a vector environment, 1 otherwise
+        """
+        return getattr(self.env, 'num_envs', 1)
+
     def get_results(self):
+        """
+        Gets the results of the environment\
+        :return: The results dictionary, or a list with the results of each sub-environment for vector environments
+        """
+        if isinstance(self.env, gym.vector.VectorEnv):
+            return list(self.env.call('get_results'))
         return self.env.get_results()
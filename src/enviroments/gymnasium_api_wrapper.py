@@ -0,0 +1,79 @@
+from typing import Tuple, Dict, Any, Optional
+
+import gymnasium as gym
+import numpy as np
+
+
+class GymnasiumAPIWrapper(gym.Wrapper):
+    """
+    Adapts environments whose reset() returns only the observation to the gymnasium API,
+    where reset(seed, options) returns (observation, info). Required to run them inside
+    gymnasium vector environments.
+    Since vector environments reset finished sub-environments automatically, the results of a finished
+    episode are added to the info of its last step under the "results" key.
+    An exception raised inside a sub-environment of an AsyncVectorEnv terminates its process, so allowed
+    exceptions are handled here: a failed step ends the episode as truncated, with the exception under the
+    "allowed_exception" key of the info instead of the results, while a failed reset is retried.
+    :param env: The environment to wrap
+    :param allowed_exceptions: Tuple of exception types that are handled instead of being raised
+    :param reset_attempts: Number of times a reset is attempted before its allowed exception is raised
+
+    Usage:
+        env = gym.vector.AsyncVectorEnv([
+            lambda: GymnasiumAPIWrapper(IntercroppingFertilizationEnv(env_1_files, env_2_files),
+                                        allowed_exceptions=(WeatherDataProviderError,))
+            for _ in range(4)
+        ])
+        states, infos = env.reset()
+        states, rewards, terminated, truncated, infos = env.step(env.action_space.sample())
+        results = env.call('get_results')
+        finished_results = [info['results'] for info in infos['final_info'] if info is not None]
+    """
+
+    def __init__(self, env: gym.Env, allowed_exceptions: tuple = (), reset_attempts: int = 3):
+        super().__init__(env)
+        self.allowed_exceptions = allowed_exceptions
+        self.reset_attempts = reset_attempts
+        self._last_observation: Optional[np.ndarray] = None
+
+    def reset(self, *, seed: Optional[int] = None,
+              options: Optional[Dict[str, Any]] = None) -> Tuple[np.ndarray, Dict[str, Any]]:
+        """
+        Resets the wrapped environment.
+        :param seed: Ignored, the wrapped environment does not support seeding on reset
+        :param options: Ignored, the wrapped environment does not support reset options
+        :return: Tuple of (observation, empty info dictionary)
+        :raises Exception: The allowed exception of the last attempt, if all the attempts failed
+        """
+        for attempt in range(self.reset_attempts):
+            try:
+                self._last_observation = self.env.reset()
+                return self._last_observation, {}
+            except self.allowed_exceptions:
+                if attempt == self.reset_attempts - 1:
+                    raise
+
+    def step(self, action: Any) -> Tuple[np.ndarray, float, bool, bool, Dict[str, Any]]:
+        """
+        Steps the wrapped environment.
+        :param action: The action to take
+        :return: Tuple of (observation, reward, terminated, truncated, info). When the episode ends,
+            info contains the episode results under the "results" key. If an allowed exception is raised,
+            the episode is truncated on the last observation with no reward, and info contains the exception repr
+            under the "allowed_exception" key.
+        """
+        try:
+            observation, reward, terminated, truncated, info = self.env.step(action)
+        except self.allowed_exceptions as e:
+            return self._last_observation, 0.0, False, True, {'allowed_exception': repr(e)}
+        self._last_observation = observation
+        if terminated or truncated:
+            info = {**info, 'results': self.env.get_results()}
+        return observation, reward, terminated, truncated, info
+
+    def get_results(self) -> Dict[str, Any]:
+        """
+        Gets the results of the wrapped environment.
+        :return: The results dictionary of the wrapped environment
+        """
+        return self.env.get_results()
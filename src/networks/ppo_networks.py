@@ -3,7 +3,6 @@ from typing import Tuple, Dict, Any
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
-from sympy.physics.units import temperature
 from torch.distributions import Categorical
 
 from src.networks.baseNetwork import BaseNetwork
@@ -71,12 +70,22 @@ class ActorNetwork(BaseNetwork):
         :param state: State tensor
         :return: Categorical distribution over actions
         """
-        logits = self(state)
+        return self.distribution_from_logits(self(state))
 
+    @staticmethod
+    def distribution_from_logits(logits: torch.Tensor, validate_args: bool = True) -> Categorical:
+        """
+        Get discrete action distribution from already computed logits.
+
+        :param logits: Action logits tensor
+        :param validate_args: Whether the distribution validates its parameters. Validation synchronizes
+            with the device, so it must be disabled inside CUDA graph captures.
+        :return: Categorical distribution over actions
+        """
         # Convert logits to probabilities using softmax
         probs = F.softmax(logits, dim=-1)
 
-        return Categorical(probs)
+        return Categorical(probs, validate_args=validate_args)
 
     def get_action_and_log_prob(self, state: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
         """
@@ -85,7 +94,6 @@ class ActorNetwork(BaseNetwork):
         :param state: State tensor
         :return: Tuple of (sampled_action, log_probability)
         """
-        logits = self(state)
         # Get distribution
         dist = self.get_distribution(state)
         # Sample action
@@ -54,11 +54,9 @@ def main():
 
     checkpoint_episode = training_config_reader.get_param("checkpoints.load_episode", v_type=int)
     checkpoints_dir = training_config_reader.get_param("checkpoints.save_path", v_type=str)
-    agent_ckp, env_ckp, training_ckp = AgentTrainer.get_checkpoint_paths(save_dir=trainings_info_dir / checkpoints_dir,
-                                                                         episode=checkpoint_episode)
-    agent.load(agent_ckp)
+    _, _, training_ckp = AgentTrainer.get_checkpoint_paths(save_dir=trainings_info_dir / checkpoints_dir,
+                                                           episode=checkpoint_episode)
     training_env = Environment(env)
-    training_env.load(env_ckp)
     trainer = AgentTrainer.from_checkpoint(agent, training_env, training_ckp)
     eval_episodes = training_config_reader.get_param("episodes.eval_episodes", v_type=int)
 
@@ -1,11 +1,13 @@
 import os
 from pathlib import Path
 
+import gymnasium as gym
 import torch
 from pcse.exceptions import WeatherDataProviderError
 
 from src.agents.PPOAgent import PPOAgent
 from src.enviroments.environment import Environment
+from src.enviroments.gymnasium_api_wrapper import GymnasiumAPIWrapper
 from src.enviroments.gymintercrop.intercropping_fertilization_env import IntercroppingFertilizationEnv
 from src.trainings.agent_trainer import AgentTrainer
 from src.trainings.utils.seed import set_seed
@@ -35,30 +37,41 @@ def main():
     seed = ppo_config_reader.get_param('training.seed', v_type=int, default=42)
     set_seed(seed)
 
-    env = IntercroppingFertilizationEnv(
-        env_1_files={
-            'crop': env_config_reader.get_param('files.env1_crop', v_type=Path),
-            'site': env_config_reader.get_param('files.env1_site', v_type=Path),
-            'soil': env_config_reader.get_param('files.env1_soil', v_type=Path),
-        },
-        env_2_files={
-            'crop': env_config_reader.get_param('files.env2_crop', v_type=Path),
-            'site': env_config_reader.get_param('files.env2_site', v_type=Path),
-            'soil': env_config_reader.get_param('files.env2_soil', v_type=Path),
-        },
+    env_1_files = {
+        'crop': env_config_reader.get_param('files.env1_crop', v_type=Path),
+        'site': env_config_reader.get_param('files.env1_site', v_type=Path),
+        'soil': env_config_reader.get_param('files.env1_soil', v_type=Path),
+    }
+    env_2_files = {
+        'crop': env_config_reader.get_param('files.env2_crop', v_type=Path),
+        'site': env_config_reader.get_param('files.env2_site', v_type=Path),
+        'soil': env_config_reader.get_param('files.env2_soil', v_type=Path),
+    }
 
-    )
+    # Several environments are stepped in parallel subprocesses to amortize the simulation cost
+    num_envs = ppo_config_reader.get_param('training.num_envs', v_type=int, default=1)
+    if num_envs > 1:
+        env = gym.vector.AsyncVectorEnv([
+            lambda: GymnasiumAPIWrapper(IntercroppingFertilizationEnv(env_1_files, env_2_files),
+                                        allowed_exceptions=(WeatherDataProviderError,))
+            for _ in range(num_envs)
+        ])
+        observation_space, action_space = env.single_observation_space, env.single_action_space
+    else:
+        env = IntercroppingFertilizationEnv(env_1_files, env_2_files)
+        observation_space, action_space = env.observation_space, env.action_space
 
     agent = PPOAgent(
-        state_dim=env.observation_space.shape[0],
+        state_dim=observation_space.shape[0],
         action_dim=1,
-        max_val=env.action_space.n,
+        max_val=action_space.n,
         config=ppo_config_reader,
-        device=torch.device('cuda')
+        device=torch.device('cuda'),
+        num_envs=num_envs
     )
     trainer = AgentTrainer(
         agent=agent,
-        env=Environment(env),
+        env=Environment(env, use_info=num_envs > 1),
         config_reader=training_config_reader
     )
 
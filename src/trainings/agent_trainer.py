@@ -1,19 +1,23 @@
+import io
 import json
 import os
 import pickle
 import random
+import zipfile
+from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
 from json import JSONDecodeError
-from typing import Dict, Any, Tuple, Set
+from typing import Dict, Any, Tuple, Set, Optional
 from pathlib import Path
 import numpy as np
 import torch
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 from numpy import floating
 from tqdm import tqdm
 import matplotlib.pyplot as plt
-import tkinter as tk
 from src.agents.agent import Agent
 from src.enviroments.environment import Environment
+from src.trainings.utils.live_returns_plotter import LiveReturnsPlotter
+from src.trainings.utils.training_checkpoint import TrainingCheckpoint
 from src.utils.configs.ini_config_reader import ConfigReader
 
 import matplotlib
@@ -35,14 +39,21 @@ class AgentTrainer:
     :ivar eval_episodes: Number of episodes used for each evaluation
     :ivar eval_frequency: How often to run evaluation (in episodes)
     :ivar max_steps_per_episode: Maximum number of steps allowed per episode
+    :ivar overlap_updates: Whether, with vector environments, the agent updates while the sub-environments step
+    :ivar update_every: Number of steps whose transitions are passed together to the agent update_batch(), if any
     :ivar save_frequency: How often to save checkpoints (in episodes)
     :ivar save_path: Directory path where checkpoints are saved
     :ivar log_path: Directory path where logs are saved
     :ivar early_stop_patience: Number of evaluations without improvement before early stopping
     :ivar early_stop_min_improvement: Minimum improvement required to reset early stopping counter
-    :ivar train_returns: List of returns from training episodes
-    :ivar eval_returns: List of average returns from evaluation periods
+    :ivar train_returns: Float32 array of returns from training episodes
+    :ivar eval_returns: Float32 array of average returns from evaluation periods
     :ivar train_steps: Total number of training steps taken
+    :ivar num_envs: Number of environments stepped in parallel, inferred from the environment
+
+    When env wraps a gymnasium vector environment, every training "episode" runs one episode in each of
+    its sub-environments in parallel, and the agent acts on and is updated with batches of states.
+    Since vector environments return (observations, infos) from reset(), they must be wrapped with use_info=True.
 
     :raises ValueError: If config file format is not an INI file or if config file format is invalid
     :raises KeyError: If config file is missing required parameters
@@ -56,6 +67,8 @@ class AgentTrainer:
             eval_episodes = 20
             eval_frequency = 10
             max_steps_per_episode = 500
+            overlap_updates = false  # Optional, only used with vector environments
+            update_every = 1  # Optional, only used with agents implementing update_batch()
 
             [checkpoints]
             save_frequency = 100
@@ -108,10 +121,8 @@ class AgentTrainer:
                 gamma=0.99
             )
 
-            # Load agent from checkpoint
-            agent_path, env_path, training_state_path = AgentTrainer.get_checkpoint_paths('./checkpoints',10)
-            agent.load(agent_path)
-            env.load(env_path)
+            # Load agent, environment and training state from checkpoint
+            _, _, training_state_path = AgentTrainer.get_checkpoint_paths('./checkpoints',10)
             trainer = AgentTrainer.from_checkpoint(
                 agent=agent,
                 env=env,
@@ -152,50 +163,110 @@ class AgentTrainer:
 """
 
     def __init__(self, agent: Agent, env: Environment, config_reader: ConfigReader):
+        self._setup(agent, env, config_reader.config_data, AgentTrainer._read_config(config_reader))
+
+    def _setup(self, agent: Agent, env: Environment, config_data: Dict, cfg: Dict[str, Any]) -> None:
+        """Initialize the trainer from an already read configuration.
+
+        :param agent: The RL agent to train
+        :param env: The training environment
+        :param config_data: The raw configuration data, stored in the checkpoints
+        :param cfg: The flat dictionary of typed parameters produced by _read_config()
+        :raises ValueError: If the agent was built for a different number of environments
+        """
         self.agent = agent
         self.env = env
+        self.num_envs = env.num_envs
+        if getattr(agent, 'num_envs', self.num_envs) != self.num_envs:
+            raise ValueError(f"The agent acts on {agent.num_envs} environments, "
+                             f"but the environment has {self.num_envs}")
         # Load config file
-        self._load_config(config_reader)
-        # Training metrics
-        self.train_returns = []
-        self.eval_returns = []
+        self.config_data = config_data
+        self._load_config(cfg)
+        # Training metrics. Returns are appended to preallocated float32 buffers, grown only when resuming
+        self._train_returns_buf = np.empty(self.train_episodes * self.num_envs, dtype=np.float32)
+        self._train_returns_len = 0
+        self._eval_returns_buf = np.empty(self.train_episodes // self.eval_frequency + 1, dtype=np.float32)
+        self._eval_returns_len = 0
         self.train_steps = 0
         self.episode = 0
         self.avg_metrics = {}
+        # Numeric metric names for each set of metric names returned by the agent, introspected once
+        self._numeric_metric_keys: Dict[Tuple[str, ...], Tuple[str, ...]] = {}
+        # Checkpoints: training states are written by a single background writer
+        self._ckpt_executor = ThreadPoolExecutor(max_workers=1)
+        self._pending_ckpt: Optional[Future] = None
         # Plotting
-        self._fig = None
-        self._ax = None
-        self._root = None
-        self._canvas = None
+        self._plotter: Optional[LiveReturnsPlotter] = None
+        self._plotted_train_returns = 0
+        self._plotted_eval_returns = 0
 
-    def _load_config(self, config_reader: ConfigReader) -> None:
-        """Load and validate configuration from an INI file.
+    @staticmethod
+    def _read_config(config_reader: ConfigReader) -> Dict[str, Any]:
+        """Read and validate all the training parameters at once.
 
         :param config_reader: A ConfigReader object with contains all the configuration of the training.
+        :return: Flat dictionary of the typed parameters, keyed by their path. Paths are already resolved
+            against the base path of the reader.
         :raises ValueError: If config file format is not an INI file or if config file format is invalid
         :raises KeyError: If config file is missing required parameters
         :raises FileNotFoundError: If config file does not exist
         """
-        self.config_data = config_reader.config_data
+        return {
+            # Episodes
+            'episodes.train_episodes': config_reader.get_param('episodes.train_episodes', v_type=int),
+            'episodes.eval_episodes': config_reader.get_param('episodes.eval_episodes', v_type=int),
+            'episodes.eval_frequency': config_reader.get_param('episodes.eval_frequency', v_type=int),
+            'episodes.max_steps_per_episode': config_reader.get_param('episodes.max_steps_per_episode', v_type=int),
+            'episodes.overlap_updates': config_reader.get_param('episodes.overlap_updates', v_type=bool,
+                                                                default=False),
+            'episodes.update_every': config_reader.get_param('episodes.update_every', v_type=int, default=1),
+            # Checkpoints
+            'checkpoints.save_frequency': config_reader.get_param('checkpoints.save_frequency', v_type=int),
+            'checkpoints.save_path': config_reader.get_param('checkpoints.save_path', v_type=Path),
+            'checkpoints.log_path': config_reader.get_param('checkpoints.log_path', v_type=Path),
+            # Seeds
+            'seeds.numpy': config_reader.get_param("seeds.numpy", v_type=int, nullable=True, default=None),
+            'seeds.python': config_reader.get_param("seeds.python", v_type=int, nullable=True, default=None),
+            'seeds.pytorch': config_reader.get_param("seeds.pytorch", v_type=int, nullable=True, default=None),
+            # Hyperparameters
+            'early_stopping.early_stop_patience': config_reader.get_param('early_stopping.early_stop_patience',
+                                                                          v_type=int),
+            'early_stopping.early_stop_min_improvement': config_reader.get_param(
+                'early_stopping.early_stop_min_improvement', v_type=float)
+        }
+
+    def _load_config(self, cfg: Dict[str, Any]) -> None:
+        """Apply the configuration read by _read_config(): set the parameters, create the checkpoint
+        directories and seed the random generators.
+
+        :param cfg: The flat dictionary of typed parameters. It is kept to be stored in the checkpoints.
+        """
+        self._cfg = cfg
         # Episodes
-        self.train_episodes = config_reader.get_param('episodes.train_episodes', v_type=int)
-        self.eval_episodes = config_reader.get_param('episodes.eval_episodes', v_type=int)
-        self.eval_frequency = config_reader.get_param('episodes.eval_frequency', v_type=int)
-        self.max_steps_per_episode = config_reader.get_param('episodes.max_steps_per_episode', v_type=int)
+        self.train_episodes = cfg['episodes.train_episodes']
+        self.eval_episodes = cfg['episodes.eval_episodes']
+        self.eval_frequency = cfg['episodes.eval_frequency']
+        self.max_steps_per_episode = cfg['episodes.max_steps_per_episode']
+        self.overlap_updates = cfg['episodes.overlap_updates']
+        # Absent from the configurations resolved by previous versions
+        self.update_every = cfg.get('episodes.update_every', 1)
         # Checkpoints
-        self.save_frequency = config_reader.get_param('checkpoints.save_frequency', v_type=int)
-        self.save_path = config_reader.get_param('checkpoints.save_path', v_type=Path)
-        self.log_path = config_reader.get_param('checkpoints.log_path', v_type=Path)
-        os.makedirs(self.save_path, exist_ok=True)
-        os.makedirs(self.save_path / 'agents', exist_ok=True)
-        os.makedirs(self.save_path / 'environments', exist_ok=True)
-        os.makedirs(self.save_path / 'trainings', exist_ok=True)
+        self.save_frequency = cfg['checkpoints.save_frequency']
+        self.save_path = cfg['checkpoints.save_path']
+        self.log_path = cfg['checkpoints.log_path']
+        # The checkpoint directories are created once here, so that saving a checkpoint needs no stat calls
+        self._agents_dir, self._envs_dir, self._trainings_dir = (
+            path.parent for path in AgentTrainer.get_checkpoint_paths(self.save_path, 0))
+        os.makedirs(self._agents_dir, exist_ok=True)
+        os.makedirs(self._envs_dir, exist_ok=True)
+        os.makedirs(self._trainings_dir, exist_ok=True)
         os.makedirs(self.log_path, exist_ok=True)
 
         # Seeds
-        np_seed = config_reader.get_param("seeds.numpy", v_type=int, nullable=True, default=None)
-        py_seed = config_reader.get_param("seeds.python", v_type=int, nullable=True, default=None)
-        torch_seed = config_reader.get_param("seeds.pytorch", v_type=int, nullable=True, default=None)
+        np_seed = cfg['seeds.numpy']
+        py_seed = cfg['seeds.python']
+        torch_seed = cfg['seeds.pytorch']
         if np_seed:
             np.random.seed(np_seed)
         if py_seed:
@@ -205,31 +276,122 @@ class AgentTrainer:
             torch.cuda.manual_seed(torch_seed)
             torch.cuda.manual_seed_all(torch_seed)
         # Hyperparameters
-        self.early_stop_patience = config_reader.get_param('early_stopping.early_stop_patience', v_type=int)
-        self.early_stop_min_improvement = config_reader.get_param('early_stopping.early_stop_min_improvement',
-                                                                  v_type=float)
+        self.early_stop_patience = cfg['early_stopping.early_stop_patience']
+        self.early_stop_min_improvement = cfg['early_stopping.early_stop_min_improvement']
+
+    @property
+    def train_returns(self) -> np.ndarray:
+        """Returns of the training episodes.
+
+        :return: view of the filled part of the training returns buffer
+        """
+        return self._train_returns_buf[:self._train_returns_len]
+
+    @train_returns.setter
+    def train_returns(self, returns: np.ndarray | list) -> None:
+        """Replace the returns of the training episodes.
+
+        :param returns: the new training returns
+        """
+        self._train_returns_buf, self._train_returns_len = AgentTrainer._append_to_buffer(
+            self._train_returns_buf, 0, returns)
+
+    @property
+    def eval_returns(self) -> np.ndarray:
+        """Average returns of the evaluations.
+
+        :return: view of the filled part of the evaluation returns buffer
+        """
+        return self._eval_returns_buf[:self._eval_returns_len]
+
+    @eval_returns.setter
+    def eval_returns(self, returns: np.ndarray | list) -> None:
+        """Replace the average returns of the evaluations.
+
+        :param returns: the new evaluation returns
+        """
+        self._eval_returns_buf, self._eval_returns_len = AgentTrainer._append_to_buffer(
+            self._eval_returns_buf, 0, returns)
+
+    @staticmethod
+    def _read_only_view(history: torch.Tensor) -> np.ndarray:
+        """View a history loaded from a checkpoint as a read-only array, without copying it.
+
+        :param history: the history tensor, possibly memory mapped
+        :return: the array sharing the memory of the tensor
+        """
+        view = history.numpy()
+        view.flags.writeable = False
+        return view
+
+    @staticmethod
+    def _append_to_buffer(buffer: np.ndarray, length: int, values: Any) -> Tuple[np.ndarray, int]:
+        """Write values after the filled part of a buffer, doubling its capacity if they do not fit.
+        Read-only buffers, as the histories mapped from a checkpoint, are always copied to a new buffer.
+
+        :param buffer: the preallocated buffer
+        :param length: the length of the filled part of the buffer
+        :param values: a value or a sequence of values to append
+        :return: (buffer, length) after the append. The buffer is a new array if it had to grow.
+        """
+        values = np.atleast_1d(values)
+        end = length + len(values)
+        if end > len(buffer) or not buffer.flags.writeable:
+            grown = np.empty(max(2 * len(buffer), end), dtype=buffer.dtype)
+            grown[:length] = buffer[:length]
+            buffer = grown
+        buffer[length:end] = values
+        return buffer, end
 
     @staticmethod
     def from_checkpoint(agent: Agent, env: Environment,
                         checkpoint_file: str | Path) -> 'AgentTrainer':
         """
         Creates an AgentTrainer instance from the given checkpoint.
-        :param agent: the agent to use for the training. Careful! Load it before starting the training with proper  methods.
-        :param env: the environment to use for the training. Careful! Load it before starting the training with proper
-            methods.
+        The states of agent and environment are loaded from the checkpoint file, or from their own files
+        in the layout of previous versions and for agents and environments without a state_dict() method.
+        :param agent: the agent to use for the training, its state is loaded from the checkpoint.
+        :param env: the environment to use for the training, its state is loaded from the checkpoint.
         :param checkpoint_file: the file that contains the training state.
         :raises FileNotFoundError: if file doesn't exist-
         :raises ValueError: if file is not in the valid format.
         :return: AgentTrainer loaded object.
         """
         try:
-            with open(checkpoint_file, 'rb') as f:
+            # Training states are torch zip archives, previous versions used plain pickle files
+            if zipfile.is_zipfile(checkpoint_file):
                 try:
-                    checkpoint = pickle.load(f)  # Changed to pickle.load since the save uses pickle.dump
-                except (pickle.PickleError, EOFError) as e:
+                    # Memory mapped: the histories are read from the file only when they are accessed
+                    checkpoint = torch.load(checkpoint_file, map_location='cpu', weights_only=False, mmap=True)
+                except (RuntimeError, pickle.PickleError, EOFError) as e:
                     raise ValueError(f"Invalid checkpoint file format: \n{e}")
+            else:
+                with open(checkpoint_file, 'rb') as f:
+                    try:
+                        checkpoint = pickle.load(f)  # Changed to pickle.load since the save uses pickle.dump
+                    except (pickle.PickleError, EOFError) as e:
+                        raise ValueError(f"Invalid checkpoint file format: \n{e}")
         except FileNotFoundError:
             raise FileNotFoundError(f"Checkpoint file not found: {checkpoint_file}")
+        if isinstance(checkpoint, TrainingCheckpoint):
+            # The parameters read when the training started are reused, with their paths already resolved
+            trainer = AgentTrainer.__new__(AgentTrainer)
+            trainer._setup(agent, env, checkpoint.config, checkpoint.resolved_config)
+            # The histories are kept as read-only views of the mapped file, copied by their first append
+            trainer._train_returns_buf = AgentTrainer._read_only_view(checkpoint.train_returns)
+            trainer._train_returns_len = len(trainer._train_returns_buf)
+            trainer._eval_returns_buf = AgentTrainer._read_only_view(checkpoint.eval_returns)
+            trainer._eval_returns_len = len(trainer._eval_returns_buf)
+            trainer.avg_metrics = {name: AgentTrainer._read_only_view(values)
+                                   for name, values in checkpoint.avg_metrics.items()}
+            trainer.train_steps = checkpoint.train_steps
+            trainer.episode = checkpoint.episode
+            AgentTrainer._load_agent_and_env(trainer, checkpoint_file, checkpoint.agent_state, checkpoint.env_state)
+            return trainer
+
+        # Training states of previous versions are pickled dictionaries
+        if not isinstance(checkpoint, dict) or 'train_returns' not in checkpoint:
+            raise ValueError(f"Invalid checkpoint file format: {checkpoint_file}")
         trainer = AgentTrainer(
             agent,
             env,
@@ -240,8 +402,32 @@ class AgentTrainer:
         trainer.train_steps = checkpoint['train_steps']
         trainer.avg_metrics = checkpoint['avg_metrics']
         trainer.episode = checkpoint['episode']
+        AgentTrainer._load_agent_and_env(trainer, checkpoint_file, None, None)
         return trainer
 
+    @staticmethod
+    def _load_agent_and_env(trainer: 'AgentTrainer', checkpoint_file: str | Path,
+                            agent_state: Optional[Dict[str, Any]], env_state: Optional[Dict[str, Any]]) -> None:
+        """Load the states of the agent and environment of a trainer restored from a checkpoint.
+        The states missing from the checkpoint file were saved to their own files, as in the three files
+        layout of previous versions.
+
+        :param trainer: the trainer restored from the checkpoint, at the episode of the checkpoint
+        :param checkpoint_file: the file that contains the training state
+        :param agent_state: the agent state stored in the checkpoint file, if any
+        :param env_state: the environment state stored in the checkpoint file, if any
+        """
+        agent_path, env_path, _ = AgentTrainer.get_checkpoint_paths(Path(checkpoint_file).parent.parent,
+                                                                     trainer.episode)
+        if agent_state is not None:
+            trainer.agent.load_state_dict(agent_state)
+        else:
+            trainer.agent.load(str(agent_path))
+        if env_state is not None:
+            trainer.env.load_state_dict(env_state)
+        else:
+            trainer.env.load(str(env_path))
+
     def plot_training_history(self, block=False, show_metrics: Set[str] = None) -> None:
         """Plot the training and evaluation returns, along with other metrics.
         Creates multiple interactive figures showing the training returns, evaluation returns,
@@ -281,12 +467,10 @@ class AgentTrainer:
         # Plot evalutation returns
 
         eval_line = None
-        if self.eval_returns:
-            eval_returns = [self.train_returns[0], ]
-            eval_returns.extend(self.eval_returns)
-            eval_episodes = range(0, len(eval_returns) * self.eval_frequency, self.eval_frequency)
-            eval_line = ax_returns.plot(eval_episodes, eval_returns, label='Evaluation Returns', linewidth=2)
-        # Plot evaluation returns if they exist
+        if len(self.eval_returns):
+            eval_returns = np.concatenate((self.train_returns[:1], self.eval_returns))
+            eval_episodes = np.arange(len(eval_returns)) * (self.eval_frequency * self.num_envs)
+            eval_line = ax_returns.plot(eval_episodes, eval_returns, label='Evaluation Returns', linewidth=2)[0]
 
         # Customize the returns plot
         ax_returns.grid(True, linestyle='--', alpha=0.7)
@@ -296,11 +480,11 @@ class AgentTrainer:
 
         # Create legend for returns plot
         leg_returns = ax_returns.legend()
+        lined_returns = {}
         if leg_returns is not None:
             leg_returns.set_draggable(True)
 
             # Set up picking for returns plot
-            lined_returns = {}
             lines_to_add = [returns_line]
             if eval_line is not None:
                 lines_to_add.append(eval_line)
@@ -310,13 +494,11 @@ class AgentTrainer:
                 legline.set_pickradius(5)
                 lined_returns[legline] = origline
         # Plot each metric in its own subplot
-        if show_metrics:
+        if show_metrics is not None:
             avg_metrics = {name: self.avg_metrics[name] for name in show_metrics}
         else:
             avg_metrics = self.avg_metrics
         for idx, (name, values) in enumerate(avg_metrics.items(), start=1):
-            if show_metrics is not None and name not in show_metrics:
-                continue
             ax = axes[idx]
             line = ax.plot(values, label=name)[0]
 
@@ -370,72 +552,22 @@ class AgentTrainer:
         # Show the plot
         plt.show(block=block)
 
-    def _plot_progress(self) -> None:
-        """Plot the training and evaluation returns.
-
-        Creates a figure showing the training returns and evaluation returns
-        over episodes.
-        """
-        if self._root is None:
-            self._root = tk.Tk()
-            self._root.protocol('WM_DELETE_WINDOW', self._on_closing)
-
-        plt.close('all')
-        self._fig, self._ax = plt.subplots(figsize=(10, 5))
-
-        # Plot training returns
-        self._ax.plot(self.train_returns, label='Training Returns', alpha=0.6)
-
-        # Plot evaluation returns
-        if self.eval_returns:
-            eval_episodes = range(0, len(self.eval_returns) * self.eval_frequency, self.eval_frequency)
-            self._ax.plot(eval_episodes, self.eval_returns, label='Evaluation Returns', linewidth=2)
-
-        self._ax.set_xlabel('Episode')
-        self._ax.set_ylabel('Return')
-        self._ax.legend()
-        self._ax.set_title('Training Progress')
-
-        if self._canvas is None:
-            self._canvas = FigureCanvasTkAgg(self._fig, master=self._root)
-            self._canvas.draw()
-            self._canvas.get_tk_widget().pack()
-
-        self._root.update()
-
     def _update_plot(self) -> None:
         """Update the live training plot.
 
         Called during training when plot_progress=True to update the plot
-        in real-time.
+        in real-time. The plot is drawn by a separate process, started on the first call or when its
+        window was closed, which is only sent the returns added since the previous call.
         """
-        if self._fig is None or self._ax is None:
-            self._plot_progress()
-        else:
-            self._ax.clear()
-            self._ax.plot(self.train_returns, label='Training Returns', alpha=0.6)
-
-            if self.eval_returns:
-                eval_episodes = range(0, len(self.eval_returns) * self.eval_frequency, self.eval_frequency)
-                self._ax.plot(eval_episodes, self.eval_returns, label='Evaluation Returns', linewidth=2)
-
-            self._ax.set_xlabel('Episode')
-            self._ax.set_ylabel('Return')
-            self._ax.legend()
-            self._ax.set_title('Training Progress')
-
-            if self._canvas:
-                self._canvas.draw()
-                self._root.update()
-
-    def _on_closing(self):
-        if self._root:
-            self._root.quit()
-            self._root.destroy()
-            self._root = None
-            self._canvas = None
-            self._fig = None
-            self._ax = None
+        if self._plotter is None or not self._plotter.is_alive():
+            self._plotter = LiveReturnsPlotter(x_max=self.train_episodes * self.num_envs,
+                                               eval_spacing=self.eval_frequency * self.num_envs)
+            self._plotter.start()
+            self._plotted_train_returns, self._plotted_eval_returns = 0, 0
+
+        self._plotter.update(self.train_returns[self._plotted_train_returns:],
+                             self.eval_returns[self._plotted_eval_returns:])
+        self._plotted_train_returns, self._plotted_eval_returns = len(self.train_returns), len(self.eval_returns)
 
     def train(self, plot_progress: bool = False, verbosity: str = "INFO", allowed_exceptions: tuple = ()) -> Dict[
         str, list]:
@@ -451,8 +583,8 @@ class AgentTrainer:
         :param verbosity: Print verbosity level ('DEBUG', 'INFO', 'WARNING', 'NONE')
         :param allowed_exceptions: Tuple of exception types that should be caught and ignored during training
         :return: Dictionary containing training metrics including:
-                - 'train_returns': List of returns from training episodes
-                - 'eval_returns': List of average returns from evaluation periods
+                - 'train_returns': Array of returns from training episodes
+                - 'eval_returns': Array of average returns from evaluation periods
                 - 'train_steps': Total number of training steps taken
         """
         # Set verbosity level
@@ -469,26 +601,34 @@ class AgentTrainer:
 
         best_eval_return = float('-inf')
         episodes_without_improvement = 0
+        # Episodes of the next evaluation and checkpoint, advanced before the episode runs so that
+        # an allowed exception does not delay them
+        next_eval, next_save = 0, 0
 
         for self.episode in tqdm(range(self.train_episodes)):
+            eval_now = self.episode == next_eval
+            if eval_now:
+                next_eval += self.eval_frequency
+            save_now = self.episode == next_save
+            if save_now:
+                next_save += self.save_frequency
             try:
 
-                train_return_item, eval_return_item = None, None
+                episode_returns, eval_return_item = None, None
                 # Training episode
                 if self.verbosity_level >= 3:
                     print(f"Starting episode {self.episode + 1}/{self.train_episodes}")
-                episode_return, avg_metrics = self._run_episode(training=True)
-                train_return_item = episode_return.item()
+                episode_returns, avg_metrics = self._run_episode(training=True)
 
                 if self.verbosity_level >= 3:
-                    print(f"\nEpisode {self.episode + 1} completed with reward: {float(episode_return):.2f}")
+                    print(f"\nEpisode {self.episode + 1} completed with reward: {episode_returns.mean():.2f}")
 
                 # Periodic evaluation
-                if self.episode % self.eval_frequency == 0:
+                if eval_now:
                     if self.verbosity_level >= 2:
                         print(f"\nRunning evaluation at episode {self.episode + 1}")
-                    eval_return = self.evaluate(self.eval_episodes, verbosity)
-                    eval_return_item = eval_return.item()
+                    eval_return, _ = self.evaluate(self.eval_episodes, verbosity)
+                    eval_return_item = eval_return
                     if self.verbosity_level >= 2:
                         print(f"Evaluation return: {eval_return:.2f}")
 
@@ -515,7 +655,7 @@ class AgentTrainer:
                         break
 
                 # Save checkpoint
-                if self.episode % self.save_frequency == 0:
+                if save_now:
                     if self.verbosity_level >= 2:
                         print(f"\nSaving checkpoint at episode {self.episode + 1}")
                     self._save_checkpoint()
@@ -524,18 +664,25 @@ class AgentTrainer:
                 if self.verbosity_level >= 1:
                     print(f"\nCaught allowed exception in episode {self.episode + 1}: {str(e)}")
                 continue
-            if train_return_item:
-                self.train_returns.append(train_return_item)
+            if episode_returns is not None:
+                self._train_returns_buf, self._train_returns_len = self._append_to_buffer(
+                    self._train_returns_buf, self._train_returns_len, episode_returns)
             if avg_metrics:
                 self._update_avg_metrics(avg_metrics)
-            if eval_return_item:
-                self.eval_returns.append(eval_return_item)
+            if eval_return_item is not None:
+                self._eval_returns_buf, self._eval_returns_len = self._append_to_buffer(
+                    self._eval_returns_buf, self._eval_returns_len, eval_return_item)
 
         # Final plot update if plotting was enabled
         if plot_progress:
             if self.verbosity_level >= 3:
                 print("Updating final training progress plot")
             self._update_plot()
+        if self._plotter is not None:
+            self._plotter.close()
+            self._plotter = None
+
+        self._wait_for_checkpoint()
 
         if self.verbosity_level >= 2:
             print("Training completed")
@@ -559,122 +706,356 @@ class AgentTrainer:
         :return: Average return across all evaluation episodes
         """
         verbosity_levels = {"DEBUG": 3, "INFO": 2, "WARNING": 1, 'NONE': 0}
-        avg_results = {}
+        # Sums of the results: one array for each layout of result names
+        accumulated_results: Dict[Tuple[str, ...], np.ndarray] = {}
         self.verbosity_level = verbosity_levels.get(verbosity, 0)
-        eval_returns = []
-        for i in range(num_episodes):
+        eval_returns = np.empty(num_episodes)
+        num_collected = 0
+        if self.num_envs > 1:
+            # The episodes are run in parallel over the sub-environments
             try:
-                if self.verbosity_level >= 3:
-                    print(f"Starting episode {i + 1}/{num_episodes}")
-                episode_return, avg_metrics, episode_results = self._run_episode(training=False, return_results=True)
+                num_collected = self._run_vector_evaluation(eval_returns, accumulated_results)
+            except allowed_exceptions as e:
+                if self.verbosity_level >= 1:
+                    print(f"Caught allowed exception in evaluation at episode {self.episode + 1}: {str(e)}")
+        else:
+            for i in range(num_episodes):
+                try:
+                    if self.verbosity_level >= 3:
+                        print(f"Starting episode {i + 1}/{num_episodes}")
+                    episode_returns, avg_metrics, episode_results = self._run_episode(training=False,
+                                                                                      return_results=True)
 
-                if self.verbosity_level >= 3:
-                    print(f"Reward of episode {i + 1}: {episode_return}")
-                eval_returns.append(episode_return.item())
+                    if not len(episode_returns):
+                        continue
+                    if self.verbosity_level >= 3:
+                        print(f"Reward of episode {i + 1}: {episode_returns[0]}")
+                    eval_returns[num_collected] = episode_returns[0]
+                    num_collected += 1
+                    self._accumulate_results(accumulated_results, episode_results[0])
+
+                except allowed_exceptions as e:
+                    if self.verbosity_level >= 1:
+                        print(f"Caught allowed exception in episode {self.episode + 1}: {str(e)}")
+                    continue
+        avg_results = defaultdict(float)
+        for keys, accumulator in accumulated_results.items():
+            for key, value in zip(keys, (accumulator / num_collected).tolist()):
+                avg_results[key] += value
+        return eval_returns[:num_collected].mean(), dict(avg_results)
+
+    def _run_vector_evaluation(self, eval_returns: np.ndarray,
+                               accumulated_results: Dict[Tuple[str, ...], np.ndarray]) -> int:
+        """Run all the evaluation episodes in a single rollout over the sub-environments of a vector environment.
+        Each sub-environment runs an equal share of the episodes, starting the next one as soon as the
+        previous ends thanks to the automatic reset, so that short episodes are not over-represented.
+        A sub-environment reaching max_steps_per_episode cannot be reset alone: its episode is counted and
+        it waits for the others to complete their share, then all the sub-environments are reset for
+        another rollout until every episode is run. Episodes ended by an allowed exception are skipped,
+        as in the single environment evaluation.
+
+        :param eval_returns: Array where the returns of the episodes are written, its length is the number of episodes
+        :param accumulated_results: Sums of the results of the episodes, updated by _accumulate_results()
+        :return: Number of episodes collected
+        """
+        num_episodes = len(eval_returns)
+        remaining = np.full(self.num_envs, num_episodes // self.num_envs)
+        remaining[:num_episodes % self.num_envs] += 1
+        num_collected = 0
+
+        while remaining.any():
+            state = self.env.reset()
+            if self.env.uses_info:
+                state, _ = state
+            self.agent.reset()
+            running_returns = np.zeros(self.num_envs)
+            episode_steps = np.zeros(self.num_envs, dtype=np.int64)
+            active = remaining > 0
+
+            while active.any():
+                action = self.agent.act(state, explore=False)
+                state, reward, terminated, truncated, info = self.env.step(action)
+                running_returns += reward
+                episode_steps += 1
+                done = terminated | truncated
+                limited = ~done & (episode_steps >= self.max_steps_per_episode) & active
+                failed = self._get_failed_episodes(done & active, info)
+
+                ended = (done & ~failed & active) | limited
+                current_results = self.env.get_results() if limited.any() else None
+                for i in np.flatnonzero(ended):
+                    eval_returns[num_collected] = running_returns[i]
+                    num_collected += 1
+                    # Finished sub-environments were already reset, their results are in the final info
+                    self._accumulate_results(accumulated_results,
+                                             info['final_info'][i]['results'] if done[i] else current_results[i])
+                    if self.verbosity_level >= 3:
+                        print(f"Reward of episode {num_collected}: {running_returns[i]}")
 
-                for key, value in episode_results.items():
-                    if key not in avg_results:
-                        avg_results[key] = value
-                    else:
-                        avg_results[key] += value
+                remaining[ended | failed] -= 1
+                # Sub-environments stopped by max_steps_per_episode wait for the reset of the next rollout
+                active &= (remaining > 0) & ~limited
+                running_returns[done] = 0
+                episode_steps[done] = 0
+        return num_collected
 
-            except allowed_exceptions as e:
-                i -= 1
-                if self.verbosity_level >= 1:
-                    print(f"Caught allowed exception in episode {self.episode + 1}: {str(e)}")
-                continue
-        for key, value in avg_results.items():
-            avg_results[key] = value / num_episodes
-        return np.mean(eval_returns), avg_results
+    @staticmethod
+    def _accumulate_results(accumulated_results: Dict[Tuple[str, ...], np.ndarray], results: Dict[str, Any]) -> None:
+        """Sum the results of an episode into the accumulated ones.
+        Results with the same names are summed into the same array, with a single vector addition.
 
-    def _run_episode(self, training: bool = True, return_results: bool = False) -> tuple[int, dict[
-        str, float | Any], Any] | tuple[int, dict[str, float | Any]]:
-        """Run a single episode in the environment.
+        :param accumulated_results: Dictionary from the result names to the array of their sums, updated in place
+        :param results: Results of the episode
+        """
+        keys = tuple(results)
+        accumulator = accumulated_results.get(keys)
+        if accumulator is None:
+            accumulator = accumulated_results[keys] = np.zeros(len(keys))
+        accumulator += np.fromiter(results.values(), dtype=np.float64, count=len(keys))
+
+    def _run_episode(self, training: bool = True, return_results: bool = False) -> tuple[np.ndarray, dict[
+        str, float | Any], list] | tuple[np.ndarray, dict[str, float | Any]]:
+        """Run a single episode in the environment, or one episode in each sub-environment of a vector environment.
+        Finished sub-environments are reset automatically by the vector environment: they keep providing
+        transitions for the agent updates until all of them are done, but their returns stop being accumulated.
+        The last transition of every sub-environment is passed to the agent as done, since the next call resets them.
+        With overlap_updates, the sub-environments step in their processes while the agent updates with the
+        previous transition: the actions are chosen before that update, so they lag the policy by one step.
+        With update_every greater than 1 and an agent implementing update_batch(), the transitions are collected
+        and passed to the agent together every update_every steps, and at the end of the episode.
+        Episodes ended by an allowed exception inside the environment are discarded from the returns and results.
 
         :param training: Whether to update the agent during the episode
-        :param training: Whether to return episode results or not
-        :return: Tuple of (total reward, average metrics dictionary)
+        :param return_results: Whether to return episode results or not
+        :return: Tuple of (total rewards of the kept episodes, average metrics dictionary) and, if
+            return_results is True, the list of the results of each kept episode
         """
         state = self.env.reset()
+        if self.env.uses_info:
+            state, _ = state
         self.agent.reset()
-        episode_return = 0
+        episode_returns = np.zeros(self.num_envs)
+        finished = np.zeros(self.num_envs, dtype=np.bool_)
+        failed = np.zeros(self.num_envs, dtype=np.bool_)
+        episode_results = [None] * self.num_envs
 
-        # Initialize metrics accumulator
-        accumulated_metrics = {}
+        # Initialize metrics accumulators: one array of sums for each layout of numeric metrics
+        accumulated_metrics: Dict[Tuple[str, ...], np.ndarray] = {}
         num_updates = 0
+        # Checked once, so that the per-step metrics printing costs nothing below DEBUG verbosity
+        debug = self.verbosity_level >= 3
 
-        for step in range(self.max_steps_per_episode):
-            # Select action
-            action = self.agent.act(state, explore=training)
+        overlap = training and self.overlap_updates and self.num_envs > 1
+        batch_updates = training and self.update_every > 1 and hasattr(self.agent, 'update_batch')
+        transitions = []
+        # Select action
+        action = self.agent.act(state, explore=training)
+        if overlap:
+            self.env.step_async(action)
 
+        for step in range(self.max_steps_per_episode):
             # Take step in environment
-            next_state, reward, terminated, truncated, _ = self.env.step(action)
-            done = terminated or truncated
+            if overlap:
+                next_state, reward, terminated, truncated, info = self.env.step_wait()
+            else:
+                next_state, reward, terminated, truncated, info = self.env.step(action)
+            done = terminated | truncated
+            last_step = step == self.max_steps_per_episode - 1 or np.all(finished | done)
+
+            # Select the next action before updating, so that the sub-environments step during the update
+            if overlap and not last_step:
+                next_action = self.agent.act(next_state, explore=training)
+                self.env.step_async(next_action)
 
             # Update agent if training
             if training:
-                metrics = self.agent.update(state, action, reward, next_state, done)
-                self.train_steps += 1
+                # The next episode starts with a reset: the sub-environments cut by max_steps_per_episode, or
+                # already in a new episode after an automatic reset, end here as truncated, so that the
+                # returns of their stored transitions are not bootstrapped across the reset
+                stored_done = done | last_step
+                if batch_updates:
+                    transitions.append((state, action, reward, next_state, stored_done))
+                    metrics = None
+                    if len(transitions) >= self.update_every or last_step:
+                        metrics = self.agent.update_batch(*self._stack_transitions(transitions))
+                        transitions.clear()
+                else:
+                    metrics = self.agent.update(state, action, reward, next_state, stored_done)
+                self.train_steps += self.num_envs
 
                 if metrics:
                     num_updates += 1
                     # Accumulate metrics
-                    for key, value in metrics.items():
-                        if isinstance(value, (int, float)):
-                            accumulated_metrics[key] = accumulated_metrics.get(key, 0) + value
+                    numeric_keys = self._get_numeric_metric_keys(metrics)
+                    accumulator = accumulated_metrics.get(numeric_keys)
+                    if accumulator is None:
+                        accumulator = accumulated_metrics[numeric_keys] = np.zeros(len(numeric_keys))
+                    accumulator += [metrics[key] for key in numeric_keys]
 
-                    if self.verbosity_level >= 3:
+                    if debug:
                         print("\nTraining metrics")
                         for key, value in metrics.items():
-                            if isinstance(value, (int, float)):
+                            if key in numeric_keys:
                                 print(f"{key}: {value:.4f}")
                             else:
                                 print(f"{key}: {value}")
 
-            episode_return += reward
+            episode_returns += np.where(finished, 0, reward)
+            failed |= self._get_failed_episodes(done & ~finished, info)
+            if return_results and self.num_envs > 1:
+                # The sub-environments that just finished were already reset, their results are in the final info
+                for i in np.flatnonzero(done & ~finished & ~failed):
+                    episode_results[i] = info['final_info'][i]['results']
+            finished |= done
             state = next_state
 
-            if done:
+            if last_step:
                 break
+            # Select action
+            action = next_action if overlap else self.agent.act(state, explore=training)
 
         # Calculate average metrics
-        avg_metrics = {}
+        avg_metrics = defaultdict(float)
         if num_updates > 0:
-            for key, value in accumulated_metrics.items():
-                avg_metrics[key] = value / num_updates
+            for numeric_keys, accumulator in accumulated_metrics.items():
+                for key, value in zip(numeric_keys, (accumulator / num_updates).tolist()):
+                    avg_metrics[key] += value
+        avg_metrics = dict(avg_metrics)
         if return_results:
-            return episode_return, avg_metrics, self.env.get_results()
-        return episode_return, avg_metrics
+            if self.num_envs == 1:
+                episode_results = [None if failed[0] else self.env.get_results()]
+            elif not finished.all():
+                current_results = self.env.get_results()
+                for i in np.flatnonzero(~finished):
+                    episode_results[i] = current_results[i]
+            return (episode_returns[~failed], avg_metrics,
+                    [results for results, is_failed in zip(episode_results, failed) if not is_failed])
+        return episode_returns[~failed], avg_metrics
+
+    def _get_failed_episodes(self, ended: np.ndarray, info: Dict[str, Any]) -> np.ndarray:
+        """Find the episodes ended by an allowed exception raised inside the environment.
+        Exceptions cannot propagate out of the sub-environments of a vector environment, so they are reported
+        in the info of the step by GymnasiumAPIWrapper.
+
+        :param ended: mask of the (sub-)environments whose episode ended at this step
+        :param info: the info returned by the step
+        :return: mask of the (sub-)environments whose episode ended because of an allowed exception
+        """
+        failed = np.zeros(self.num_envs, dtype=np.bool_)
+        for i in np.flatnonzero(ended):
+            episode_info = info['final_info'][i] if self.num_envs > 1 else info
+            if 'allowed_exception' in episode_info:
+                failed[i] = True
+                if self.verbosity_level >= 1:
+                    print(f"\nCaught allowed exception in environment {i}: {episode_info['allowed_exception']}")
+        return failed
+
+    def _stack_transitions(self, transitions: list) -> Tuple[np.ndarray, ...]:
+        """Join the transitions of consecutive steps into batches.
+
+        :param transitions: the (state, action, reward, next_state, done) tuples of each step
+        :return: (states, actions, rewards, next_states, dones) with one row per transition. With a vector
+            environment, the transitions of each step are in environment order.
+        """
+        join = np.concatenate if self.num_envs > 1 else np.stack
+        return tuple(join(column) for column in zip(*transitions))
+
+    def _get_numeric_metric_keys(self, metrics: Dict[str, Any]) -> Tuple[str, ...]:
+        """Get the names of the numeric metrics, the only ones that are averaged.
+        Agents return the same metric types at every update, so the types are only checked the first time
+        a set of metric names is seen.
+
+        :param metrics: the metrics returned by an agent update
+        :return: the names of the numeric metrics
+        """
+        keys = tuple(metrics)
+        numeric_keys = self._numeric_metric_keys.get(keys)
+        if numeric_keys is None:
+            numeric_keys = tuple(key for key, value in metrics.items() if isinstance(value, (int, float)))
+            self._numeric_metric_keys[keys] = numeric_keys
+        return numeric_keys
 
     def _save_checkpoint(self) -> None:
         """Save the current state of training to disk.
+        Agent, environment and training state go to a single file, to keep the file system metadata operations
+        per checkpoint low. The states are snapshotted and written in background, overlapping with the
+        following episodes. Agents and environments without a state_dict() method, as DQN and SAC agents,
+        are saved immediately to their own files instead, since they keep changing during training.
+        Returns and metrics histories are stored as float32 tensors inside the checkpoint file.
         """
-        save_dir = Path(self.save_path)
-        save_dir.mkdir(parents=True, exist_ok=True)
+        # Single writer: the previous checkpoint must be completely written before starting a new one
+        self._wait_for_checkpoint()
 
-        checkpoint = {
-            'episode': self.episode,
-            'train_returns': self.train_returns,
-            'eval_returns': self.eval_returns,
-            'train_steps': self.train_steps,
-            'avg_metrics': self.avg_metrics,
-            'config': self.config_data
-        }
+        file_name = f"agent_ep{self.episode}.pt"
+        agent_state = env_state = None
+        if hasattr(self.agent, 'state_dict'):
+            agent_state = AgentTrainer._snapshot_state(self.agent.state_dict())
+        else:
+            self.agent.save(str(self._agents_dir / file_name))
+        if hasattr(self.env, 'state_dict'):
+            env_state = AgentTrainer._snapshot_state(self.env.state_dict())
+        else:
+            self.env.save(str(self._envs_dir / file_name))
+
+        checkpoint = TrainingCheckpoint(
+            episode=self.episode,
+            train_steps=self.train_steps,
+            config=self.config_data,
+            resolved_config=self._cfg,
+            train_returns=torch.from_numpy(self.train_returns.copy()),
+            eval_returns=torch.from_numpy(self.eval_returns.copy()),
+            avg_metrics={key: torch.tensor(values, dtype=torch.float32) for key, values in self.avg_metrics.items()},
+            agent_state=agent_state,
+            env_state=env_state
+        )
+        self._pending_ckpt = self._ckpt_executor.submit(AgentTrainer._write_training_state, checkpoint,
+                                                        self._trainings_dir / file_name)
 
-        if hasattr(self.agent, 'actor_scheduler') and hasattr(self.agent, 'critic_scheduler'):
-            checkpoint.update({
-                'actor_scheduler': self.agent.actor_scheduler.state_dict(),
-                'critic_scheduler': self.agent.critic_scheduler.state_dict()
-            })
-
-        agent_path, env_path, state_path = AgentTrainer.get_checkpoint_paths(save_dir, self.episode)
-        # Save agent
-        self.agent.save(str(agent_path))
-        # Save environment
-        self.env.save(str(env_path))
-        # Save training state
-        with open(state_path, 'wb') as f:
-            pickle.dump(checkpoint, f)
+    @staticmethod
+    def _snapshot_state(state: Any) -> Any:
+        """Copy a state dictionary, moving its tensors to the CPU, so that it can be written in background
+        while the original keeps changing.
+
+        :param state: a state dictionary, possibly nested, as returned by state_dict() methods
+        :return: the copy of the state
+        """
+        if isinstance(state, torch.Tensor):
+            return state.detach().to('cpu', copy=True)
+        if isinstance(state, np.ndarray):
+            return state.copy()
+        if isinstance(state, dict):
+            return {key: AgentTrainer._snapshot_state(value) for key, value in state.items()}
+        if isinstance(state, (list, tuple)):
+            return type(state)(AgentTrainer._snapshot_state(value) for value in state)
+        return state
+
+    def _wait_for_checkpoint(self) -> None:
+        """Wait until the checkpoint being written in background, if any, is on disk.
+
+        :raises OSError: If writing the checkpoint failed
+        """
+        if self._pending_ckpt is not None:
+            pending, self._pending_ckpt = self._pending_ckpt, None
+            pending.result()
+
+    @staticmethod
+    def _write_training_state(checkpoint: TrainingCheckpoint, state_path: Path) -> None:
+        """Write the training state of a checkpoint to disk.
+
+        :param checkpoint: the training state snapshot
+        :param state_path: the file where to write the training state
+        """
+        # Serialized in memory first, so that the file is written with as few unbuffered writes as possible
+        buffer = io.BytesIO()
+        torch.save(checkpoint, buffer, _use_new_zipfile_serialization=True)
+        # Written aside and renamed, so that a checkpoint memory mapped by a resumed training is never truncated
+        tmp_path = state_path.with_suffix('.tmp')
+        with open(tmp_path, 'wb', buffering=0) as f, buffer.getbuffer() as data:
+            # A raw write can be partial, e.g. Linux writes at most about 2 GiB per call
+            written = 0
+            while written < len(data):
+                written += f.write(data[written:])
+        os.replace(tmp_path, state_path)
 
     @staticmethod
     def get_checkpoint_paths(save_dir: str | Path, episode: int) -> Tuple[Path, Path, Path]:
@@ -696,4 +1077,7 @@ class AgentTrainer:
             if key not in self.avg_metrics.keys():
                 self.avg_metrics[key] = [value]
             else:
+                if not isinstance(self.avg_metrics[key], list):
+                    # History mapped from a checkpoint, copied by its first append
+                    self.avg_metrics[key] = self.avg_metrics[key].tolist()
                 self.avg_metrics[key].append(value)
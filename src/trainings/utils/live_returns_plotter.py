@@ -0,0 +1,166 @@
+import multiprocessing as mp
+import tkinter as tk
+from multiprocessing.queues import Queue
+from queue import Empty
+from typing import List, Optional, Sequence
+
+import numpy as np
+from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+from matplotlib.figure import Figure
+
+
+class LiveReturnsPlotter:
+    """
+    Live plot of the training and evaluation returns, drawn by a separate process so that rendering and
+    Tk event handling never block the training loop. Updates are sent through a queue and only contain
+    the returns added since the previous update.\
+    :param x_max: Initial length of the episodes axis, extended when exceeded
+    :param eval_spacing: Number of training returns between two evaluation returns
+    :ivar process: The plotting process, None until start() is called
+
+    Usage:
+        plotter = LiveReturnsPlotter(x_max=1000, eval_spacing=10)
+        plotter.start()
+
+        # During training, send only the new returns
+        plotter.update(train_returns=[-12.5, -10.1], eval_returns=[-11.0])
+
+        # Closes the window and waits for the plotting process
+        plotter.close()
+    """
+
+    def __init__(self, x_max: int, eval_spacing: int):
+        self.x_max = x_max
+        self.eval_spacing = eval_spacing
+        # Spawned, so that the plotting process does not inherit the CUDA context or the training threads
+        self._context = mp.get_context('spawn')
+        self._queue: Queue = self._context.Queue()
+        self.process: Optional[mp.Process] = None
+
+    def start(self) -> None:
+        """
+        Starts the plotting process, which opens the plot window.
+        """
+        self.process = self._context.Process(
+            target=LiveReturnsPlotter._run,
+            args=(self._queue, self.x_max, self.eval_spacing),
+            daemon=True
+        )
+        self.process.start()
+
+    def is_alive(self) -> bool:
+        """
+        Checks whether the plot window is open.
+        :return: True if the plotting process is running, False if it was not started or the window was closed
+        """
+        return self.process is not None and self.process.is_alive()
+
+    def update(self, train_returns: Sequence[float], eval_returns: Sequence[float]) -> None:
+        """
+        Sends new returns to the plot, without waiting for them to be drawn.
+        :param train_returns: Training returns added since the last update
+        :param eval_returns: Evaluation returns added since the last update
+        """
+        if self.is_alive():
+            self._queue.put_nowait((list(train_returns), list(eval_returns)))
+
+    def close(self) -> None:
+        """
+        Closes the plot window and waits for the plotting process to terminate.
+        """
+        if self.is_alive():
+            self._queue.put_nowait(None)
+            self.process.join()
+        self.process = None
+
+    @staticmethod
+    def _run(queue: Queue, x_max: int, eval_spacing: int) -> None:
+        """
+        Body of the plotting process: owns the Tk window and draws the returns received from the queue.
+        The lines are animated and blitted over a cached background, which is redrawn only when the
+        returns exceed the axes limits.
+        :param queue: Queue of (train_returns, eval_returns) updates, terminated by None
+        :param x_max: Initial length of the episodes axis
+        :param eval_spacing: Number of training returns between two evaluation returns
+        """
+        root = tk.Tk()
+        root.wm_title('Training Progress')
+        root.protocol('WM_DELETE_WINDOW', root.destroy)
+
+        fig = Figure(figsize=(10, 5))
+        ax = fig.add_subplot()
+        train_line = ax.plot([], [], label='Training Returns', alpha=0.6, animated=True)[0]
+        eval_line = ax.plot([], [], label='Evaluation Returns', linewidth=2, animated=True)[0]
+        ax.set_xlim(0, max(1, x_max))
+        ax.set_xlabel('Episode')
+        ax.set_ylabel('Return')
+        ax.legend()
+        ax.set_title('Training Progress')
+
+        canvas = FigureCanvasTkAgg(fig, master=root)
+        canvas.get_tk_widget().pack()
+
+        train_returns: List[float] = []
+        eval_returns: List[float] = []
+        background = None
+
+        def rescale() -> bool:
+            """
+            Extends the axes limits if the returns exceed them.
+            :return: Whether the limits changed
+            """
+            rescaled = False
+            current_x_max = ax.get_xlim()[1]
+            if len(train_returns) > current_x_max:
+                ax.set_xlim(0, max(2 * current_x_max, len(train_returns)))
+                rescaled = True
+
+            if train_returns or eval_returns:
+                returns = np.asarray(train_returns + eval_returns)
+                low, high = returns.min(), returns.max()
+                y_min, y_max = ax.get_ylim()
+                if low < y_min or high > y_max or background is None:
+                    margin = 0.1 * (high - low) or 1.0
+                    ax.set_ylim(low - margin, high + margin)
+                    rescaled = True
+            return rescaled
+
+        def redraw() -> None:
+            """
+            Redraws the lines with the received returns.
+            """
+            nonlocal background
+            train_line.set_data(np.arange(len(train_returns)), train_returns)
+            eval_line.set_data(np.arange(len(eval_returns)) * eval_spacing, eval_returns)
+
+            if rescale() or background is None:
+                canvas.draw()
+                background = canvas.copy_from_bbox(ax.bbox)
+
+            canvas.restore_region(background)
+            ax.draw_artist(train_line)
+            ax.draw_artist(eval_line)
+            canvas.blit(ax.bbox)
+
+        def poll() -> None:
+            """
+            Consumes all the pending updates, then schedules itself again.
+            """
+            updated = False
+            try:
+                while True:
+                    item = queue.get_nowait()
+                    if item is None:
+                        root.destroy()
+                        return
+                    train_returns.extend(item[0])
+                    eval_returns.extend(item[1])
+                    updated = True
+            except Empty:
+                pass
+            if updated:
+                redraw()
+            root.after(100, poll)
+
+        root.after(0, poll)
+        root.mainloop()
@@ -0,0 +1,49 @@
+from dataclasses import dataclass
+from typing import Dict, Any, Optional
+
+import torch
+
+
+@dataclass(slots=True)
+class TrainingCheckpoint:
+    """
+    State of an AgentTrainer checkpoint, saved with torch.save to a single file together with the agent
+    and environment states.
+    The histories are float32 tensors, so that they are stored as raw storages of the archive
+    and can be memory mapped when the checkpoint is loaded.
+    :ivar episode: Episode at which the checkpoint was saved
+    :ivar train_steps: Total number of training steps taken
+    :ivar config: The configuration data of the training
+    :ivar resolved_config: The typed parameters read from the configuration, with their paths resolved
+    :ivar train_returns: Returns of the training episodes
+    :ivar eval_returns: Average returns of the evaluations
+    :ivar avg_metrics: History of each averaged training metric
+    :ivar agent_state: State of the agent returned by its state_dict(). None if the agent has no state_dict(),
+        and is saved to its own file instead
+    :ivar env_state: State of the environment returned by its state_dict(). None if the environment has no
+        state_dict(), and is saved to its own file instead
+
+    Usage:
+        checkpoint = TrainingCheckpoint(
+            episode=100,
+            train_steps=50000,
+            config=config_reader.config_data,
+            resolved_config={'episodes.train_episodes': 1000},
+            train_returns=torch.zeros(100),
+            eval_returns=torch.zeros(10),
+            avg_metrics={'policy_loss': torch.zeros(100)},
+            agent_state=agent.state_dict(),
+            env_state=env.state_dict()
+        )
+        torch.save(checkpoint, 'trainings/agent_ep100.pt')
+        checkpoint = torch.load('trainings/agent_ep100.pt', weights_only=False, mmap=True)
+    """
+    episode: int
+    train_steps: int
+    config: Dict[str, Any]
+    resolved_config: Dict[str, Any]
+    train_returns: torch.Tensor
+    eval_returns: torch.Tensor
+    avg_metrics: Dict[str, torch.Tensor]
+    agent_state: Optional[Dict[str, Any]] = None
+    env_state: Optional[Dict[str, Any]] = None